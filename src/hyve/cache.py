@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = ".npz"
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def grid_fingerprint(*arrays):
+    """Return a SHA-256 hex digest of the shapes, dtypes and values of arrays."""
+    digest = hashlib.sha256()
+    for arr in arrays:
+        arr = np.ascontiguousarray(arr)
+        digest.update(f"{arr.shape}{arr.dtype.str}".encode())
+        digest.update(arr.tobytes())
+    return digest.hexdigest()
+
+
+def mapping_cache_key(station_config: dict[str, Any], grid_fingerprint: str) -> str:
+    """
+    Build the content-addressed key of a station to grid mapping.
+
+    The key covers the station file content, every station config entry that
+    affects the mapping (name, filter, index/coords columns) and the grid
+    geometry, so any change to those yields a new cache entry.
+    """
+    config = {k: v for k, v in station_config.items() if k != "file"}
+    payload = json.dumps(
+        {
+            "station_file": file_hash(station_config["file"]),
+            "station_config": config,
+            "grid": grid_fingerprint,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def load_mapping(cache_dir, key) -> dict[str, np.ndarray] | None:
+    """
+    Load a cached mapping, returning None on a miss.
+
+    A hit refreshes the entry's modification time so that size-based eviction
+    removes the least recently used entries first.
+    """
+    path = Path(cache_dir) / f"{key}{CACHE_SUFFIX}"
+    if not path.exists():
+        logger.debug(f"Mapping cache miss: {path}")
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            mapping = {name: data[name] for name in data.files}
+    except (OSError, ValueError) as err:
+        logger.warning(f"Ignoring unreadable mapping cache entry {path}: {err}")
+        return None
+    os.utime(path)
+    logger.info(f"Loaded station mapping from cache: {path}")
+    return mapping
+
+
+def save_mapping(cache_dir, key, **arrays):
+    """Atomically write a mapping entry as a compressed `.npz` sidecar."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f"{key}{CACHE_SUFFIX}"
+    tmp_path = cache_dir / f".{key}.{os.getpid()}.tmp{CACHE_SUFFIX}"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+    logger.info(f"Saved station mapping to cache: {path}")
+    return path
+
+
+def evict(cache_dir, max_bytes=None, max_age=None):
+    """
+    Apply the eviction policy to a cache directory.
+
+    Parameters
+    ----------
+    cache_dir : str or pathlib.Path
+        The cache directory.
+    max_bytes : int, optional
+        Maximum total size of the cache. Least recently used entries are
+        removed until the cache fits.
+    max_age : float, optional
+        Maximum age in seconds since an entry was last used.
+
+    Returns
+    -------
+    list of pathlib.Path
+        The removed entries.
+    """
+    cache_dir = Path(cache_dir)
+    if not cache_dir.is_dir():
+        return []
+    entries = sorted(
+        (path.stat().st_mtime, path.stat().st_size, path)
+        for path in cache_dir.glob(f"*{CACHE_SUFFIX}")
+        if not path.name.startswith(".")
+    )
+    removed = []
+    if max_age is not None:
+        cutoff = time.time() - max_age
+        removed.extend(path for mtime, _, path in entries if mtime < cutoff)
+        entries = [entry for entry in entries if entry[0] >= cutoff]
+    if max_bytes is not None:
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            removed.append(path)
+            total -= size
+    for path in removed:
+        path.unlink(missing_ok=True)
+    if removed:
+        logger.info(f"Evicted {len(removed)} entries from mapping cache {cache_dir}")
+    return removed
+
+
+def clear_cache(cache_dir):
+    """Remove every entry from a cache directory."""
+    return evict(cache_dir, max_bytes=0)
@@ -4,6 +4,7 @@ import sys
 
 import yaml
 
+from hyve.climatology import climatology
 from hyve.extraction import extractor
 from hyve.hydrostats.stat_calc import stat_calc
 
@@ -27,6 +28,7 @@ def commandlineify(func):
 
 extractor_cli = commandlineify(extractor)
 stat_calc_cli = commandlineify(stat_calc)
+climatology_cli = commandlineify(climatology)
 
 
 if __name__ == "__main__":
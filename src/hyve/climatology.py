@@ -0,0 +1,760 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import dask.array
+import numpy as np
+import xarray as xr
+from numpy.lib.stride_tricks import sliding_window_view
+
+from hyve import sketch
+from hyve.core import load_da, peak_rss_mb
+from hyve.output import output_format, write_output
+
+try:
+    import numba
+except ImportError:  # numba is an optional dependency
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+METHODS = ["exact", "sliding", "sketch"]
+
+DAYS_PER_YEAR = 365
+# day of year of February 29, replaced by February 28 in leap-year outputs
+LEAP_DAY = 59
+# default memory budget of the samples gathered at once by each worker
+BLOCK_BYTES = 256 * 2**20
+# years are sketched in slices of about SLICE_SAMPLES * compression samples
+SLICE_SAMPLES = 4
+
+
+def steps_per_day(times):
+    """Return the number of time steps per day of a regular time axis."""
+    step = np.diff(times[:2])[0]
+    freq = np.timedelta64(1, "D") // step
+    if freq < 1 or np.timedelta64(1, "D") % step:
+        raise ValueError(f"Time step {step} does not divide a day")
+    return int(freq)
+
+
+def window_steps(window, freq, stride=1):
+    """Return the number of time steps spanned by a window of days."""
+    return window * freq - (window * freq) % stride + 1
+
+
+def _hour(times):
+    return (times.astype("datetime64[h]") - times.astype("datetime64[D]")).astype(int)
+
+
+def extended_positions(times, n_window):
+    """
+    Positions of the time steps sampled by the climatology windows.
+
+    Steps of February 29 (counted as days starting after midnight) are
+    removed and the series is wrapped around by half a window at both ends,
+    so that windows of the first and last days of the year are complete.
+    """
+    month = times.astype("datetime64[M]").astype(int) % 12 + 1
+    day = (times.astype("datetime64[D]") - times.astype("datetime64[M]")).astype(int)
+    leap = np.flatnonzero((month == 2) & (day + 1 == 29)) + 1
+    kept = np.delete(np.arange(times.size), leap[leap < times.size])
+    before = n_window // 2
+    after = n_window - before
+    return np.concatenate((kept[-before:], kept, kept[:after]))
+
+
+def window_indices(times, n_window, freq, stride=1, n_days=366):
+    """
+    Build the window start and sample offsets of every day and hour.
+
+    Returns
+    -------
+    starts : numpy.ndarray
+        Window starts into the extended series of `extended_positions`, shape
+        (freq, n_days, n_years).
+    offsets : list of numpy.ndarray
+        Offsets of the samples within the window for each hour of the day,
+        i.e. the steps at that hour of the day.
+    """
+    ext = extended_positions(times, n_window)
+    n_dates = DAYS_PER_YEAR * freq
+    n_years, remainder = divmod(ext.size - n_window, n_dates)
+    if remainder or n_years < 1:
+        raise ValueError(
+            "The climatology needs whole years of data, starting with the first "
+            "time step of January 1"
+        )
+    hours = _hour(times[ext])
+    days = np.arange(n_days)
+    # February 29 reuses the February 28 window
+    days = np.where(days >= LEAP_DAY, days - (n_days > DAYS_PER_YEAR), days)
+    years = np.arange(n_years) * n_dates
+    window = np.arange(0, n_window, stride)
+    starts = []
+    offsets = []
+    for ihour in range(freq):
+        start = days[:, None] * freq + ihour + years[None, :]
+        # keep the samples at the same hour of the day as the target step
+        match = hours[start[..., None] + window] == 24 // freq * ihour
+        if not np.all(match == match[0, 0]):
+            raise ValueError("Time steps are not regular")
+        if not match[0, 0].any():
+            raise ValueError(
+                f"No samples at hour {24 // freq * ihour} with a stride of {stride}"
+            )
+        starts.append(start)
+        offsets.append(window[match[0, 0]])
+    return np.stack(starts), offsets
+
+
+def time_labels(freq, n_days=366):
+    """Return the "MM-DDTHH" labels of the steps of a leap year."""
+    start = np.datetime64("2020-01-01T00", "h") + np.timedelta64(24 // freq, "h")
+    dates = start + np.arange(n_days * freq) * np.timedelta64(24 // freq, "h")
+    return [date[5:] for date in np.datetime_as_string(dates, unit="h")]
+
+
+def _gather_samples(values, starts, offsets, n_window):
+    # windows[t, point, w] is values[t + w, point], a view without copies
+    windows = sliding_window_view(values, n_window, axis=0)
+    # only the selected samples are copied, shape (day, year, sample, point)
+    samples = windows[starts[..., None], :, offsets]
+    n_days, _, _, n_points = samples.shape
+    return samples.transpose(0, 3, 1, 2).reshape(n_days, n_points, -1)
+
+
+def _percentile_block(values, starts, offsets, n_window, percentiles):
+    samples = _gather_samples(values, starts, offsets, n_window)
+    # a single partition of the samples gives every percentile
+    return np.percentile(samples, percentiles, axis=-1).transpose(1, 0, 2)
+
+
+def _chunk_size(n_samples, point_shape, itemsize):
+    # n_samples are held at once per point, for the first point dim
+    n_samples *= int(np.prod(point_shape[1:], dtype=int))
+    return max(1, BLOCK_BYTES // (n_samples * itemsize))
+
+
+def _n_samples(starts, offsets):
+    # samples of all days of one hour of the day
+    return starts[0].size * max(o.size for o in offsets)
+
+
+def default_chunk_size(da, window=30, stride=1, n_days=366, time_dim="time"):
+    """
+    Default number of points along the first point dimension of a block.
+
+    Blocks of stations (or rows of a grid) are sized so that the samples of
+    every day of one hour of the day, gathered at once by each worker, fit in
+    `BLOCK_BYTES` (256 MiB). Peak memory then grows with ``workers`` rather
+    than with the number of points. Parameters are those of
+    `compute_climatology`.
+    """
+    times = da[time_dim].values
+    freq = steps_per_day(times)
+    n_window = window_steps(window, freq, stride)
+    starts, offsets = window_indices(times, n_window, freq, stride, n_days)
+    point_shape = da.transpose(time_dim, ...).shape[1:]
+    return _chunk_size(_n_samples(starts, offsets), point_shape, da.dtype.itemsize)
+
+
+def _map_blocks(func, n_points, chunk_size, workers=1):
+    # blocks are disjoint slices of points, written concurrently by the workers
+    blocks = [
+        slice(start, start + chunk_size) for start in range(0, n_points, chunk_size)
+    ]
+    logger.debug(f"{len(blocks)} blocks of {chunk_size} points")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # consume the results to raise errors of the workers
+        list(executor.map(func, blocks))
+
+
+def window_moves(starts, offsets):
+    """
+    Samples leaving and entering the window from one day to the next.
+
+    Parameters
+    ----------
+    starts : numpy.ndarray
+        Window starts of one hour of the day, shape (n_days, n_years).
+    offsets : numpy.ndarray
+        Offsets of the samples within the window.
+
+    Returns
+    -------
+    positions : numpy.ndarray
+        Positions of all samples of each day, shape (n_days, n_samples).
+    leaving, entering : numpy.ndarray
+        Positions of the samples replaced from the previous day, shape
+        (n_days, n_moves), paired one to one.
+    n_moves : numpy.ndarray
+        Number of valid moves of each day, 0 when the window does not move.
+    """
+    positions = (starts[..., None] + offsets).reshape(starts.shape[0], -1)
+    shifts = np.unique(np.diff(starts, axis=0))
+    if shifts.size > 2 or np.any(shifts < 0):
+        raise ValueError("Window starts must move forward by a constant step")
+    shift = shifts.max(initial=0)
+    # offsets, relative to the previous start, of the samples that change
+    leave = np.setdiff1d(offsets, offsets + shift)
+    enter = np.setdiff1d(offsets + shift, offsets)
+    moved = np.diff(starts[:, 0], prepend=starts[0, 0]) > 0
+    previous = np.concatenate((starts[:1], starts[:-1]))[..., None]
+    n_days = starts.shape[0]
+    return (
+        positions,
+        (previous + leave).reshape(n_days, -1),
+        (previous + enter).reshape(n_days, -1),
+        np.where(moved, leave.size * starts.shape[1], 0),
+    )
+
+
+def _less(a, b):
+    # total order with NaNs last, as in numpy.sort
+    return a < b or (b != b and a == a)
+
+
+def _replace_sorted(buffer, old, new):
+    # binary search of the first occurrence of old
+    lo, hi = 0, buffer.size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _less(buffer[mid], old):
+            lo = mid + 1
+        else:
+            hi = mid
+    # shift neighbours over the slot until new is in order, so that the cost
+    # is the change of rank rather than the buffer size
+    i = lo
+    while i + 1 < buffer.size and _less(buffer[i + 1], new):
+        buffer[i] = buffer[i + 1]
+        i += 1
+    while i > 0 and _less(new, buffer[i - 1]):
+        buffer[i] = buffer[i - 1]
+        i -= 1
+    buffer[i] = new
+
+
+def _sorted_percentiles(buffer, percentiles, out):
+    last = buffer.size - 1
+    for j in range(percentiles.size):
+        if buffer[last] != buffer[last]:
+            out[j] = np.nan
+            continue
+        h = last * percentiles[j] / 100.0
+        lo = min(int(h), last)
+        hi = min(lo + 1, last)
+        out[j] = buffer[lo] + (h - lo) * (buffer[hi] - buffer[lo])
+
+
+def _sliding_loop(values, positions, leaving, entering, n_moves, percentiles, out):
+    # out has shape (n_days, n_percentiles, n_points)
+    n_days, n_samples = positions.shape
+    for p in range(values.shape[1]):
+        buffer = np.empty(n_samples)
+        for d in range(n_days):
+            if d == 0 or 4 * n_moves[d] > n_samples:
+                for k in range(n_samples):
+                    buffer[k] = values[positions[d, k], p]
+                buffer.sort()
+            else:
+                for k in range(n_moves[d]):
+                    _replace_sorted(
+                        buffer, values[leaving[d, k], p], values[entering[d, k], p]
+                    )
+            _sorted_percentiles(buffer, percentiles, out[d, :, p])
+
+
+if numba is not None:
+    _less = numba.njit(cache=True, nogil=True)(_less)
+    _replace_sorted = numba.njit(cache=True, nogil=True)(_replace_sorted)
+    _sorted_percentiles = numba.njit(cache=True, nogil=True)(_sorted_percentiles)
+    _sliding_loop = numba.njit(cache=True, nogil=True)(_sliding_loop)
+
+
+def _sliding_block(values, starts, offsets, percentiles):
+    positions, leaving, entering, n_moves = window_moves(starts, offsets)
+    out = np.empty((starts.shape[0], percentiles.size, values.shape[1]))
+    _sliding_loop(
+        np.ascontiguousarray(values, dtype=float),
+        positions,
+        leaving,
+        entering,
+        n_moves,
+        np.asarray(percentiles, dtype=float),
+        out,
+    )
+    return out
+
+
+def _climatology_array(data, da, percentiles, freq, n_days):
+    # da has time as its first dimension
+    point_dims = da.dims[1:]
+    coords = {
+        "time": time_labels(freq, n_days),
+        "percentile": ("ensemble", np.asarray(percentiles)),
+    }
+    coords.update({dim: da[dim] for dim in point_dims if dim in da.coords})
+    return xr.DataArray(
+        data, dims=("time", "ensemble", *point_dims), coords=coords, name=da.name
+    )
+
+
+def climatology_template(da, percentiles, n_days=366, time_dim="time", chunk_size=None):
+    """
+    Lazy, empty climatology of `da`, e.g. to set up an output store.
+
+    The template has the dimensions and coordinates of `compute_climatology`,
+    with dask chunks of ``chunk_size`` along the first point dimension.
+    """
+    freq = steps_per_day(da[time_dim].values)
+    da = da.transpose(time_dim, ...)
+    shape = (n_days * freq, len(percentiles)) + da.shape[1:]
+    chunks = [-1] * len(shape)
+    if chunk_size and da.ndim > 1:
+        chunks[2] = chunk_size
+    data = dask.array.empty(shape, chunks=tuple(chunks), dtype=da.dtype)
+    return _climatology_array(data, da, percentiles, freq, n_days)
+
+
+def compute_climatology(
+    da,
+    percentiles,
+    window=30,
+    stride=1,
+    n_days=366,
+    time_dim="time",
+    chunk_size=None,
+    method="exact",
+    out=None,
+    workers=1,
+    compression=100,
+):
+    """
+    Compute percentile climatologies over moving windows of days.
+
+    For each step of the year, the samples are the steps at the same hour of
+    the day within ``window`` days in every year. The index cube of window
+    starts is built once, and samples of all days are gathered from a strided
+    view of the series, so that all percentiles of all days are computed in
+    one call per hour of the day and block of points.
+
+    The "sliding" method instead keeps a sorted buffer of the samples of each
+    point and moves the window one day at a time, replacing the samples that
+    leave the window by those that enter it. With a stride of 1 a single
+    sample per year changes from one day to the next, so the cost scales with
+    the number of years rather than the window size. Larger strides share few
+    samples between days and the buffer is sorted again. It needs Numba and
+    falls back to the exact method otherwise.
+
+    The "sketch" method computes approximate percentiles from the mergeable
+    sketches of `climatology_sketch`.
+
+    Results are written in place into a single preallocated output, or into
+    ``out``, block by block of points as they complete. Blocks are disjoint,
+    so ``workers`` threads write them concurrently.
+
+    Parameters
+    ----------
+    da : xarray.DataArray
+        Regular time series covering whole years, from the first time step of
+        January 1. Every other dimension is treated as independent points.
+    percentiles : array_like
+        Percentiles to compute, in [0, 100].
+    window : int, optional
+        Window length in days. Default is 30.
+    stride : int, optional
+        Stride between samples in time steps (7 for seasonal). Default is 1.
+    n_days : int, optional
+        Number of days of the output, 366 for a leap year. Default is 366.
+    time_dim : str, optional
+        Name of the time dimension. Default is "time".
+    chunk_size : int, optional
+        Number of points along the first point dimension processed at once,
+        bounding memory use. Default is `default_chunk_size`.
+    method : {"exact", "sliding", "sketch"}, optional
+        Batch percentiles of each day, incrementally updated sorted buffers,
+        which give the same results, or approximate quantile sketches.
+        Default is "exact".
+    out : array_like, optional
+        Array of shape (time, percentile, *point_shape) written in place, e.g.
+        a NumPy memmap or a Zarr array. Zarr chunks along the first point
+        dimension should be multiples of ``chunk_size`` for concurrent writes.
+        Default is a new NumPy array.
+    workers : int, optional
+        Number of threads computing blocks of points. Default is 1.
+    compression : int, optional
+        Compression of the "sketch" method, see `hyve.sketch.compress`.
+        Default is 100.
+
+    Returns
+    -------
+    xarray.DataArray
+        Dimensions ("time", "ensemble", *point_dims) with "MM-DDTHH" time
+        labels and percentiles along "ensemble". Wraps ``out`` without a
+        copy, lazily if it is not a NumPy array.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown climatology method '{method}', expected {METHODS}")
+    if method == "sliding" and numba is None:
+        logger.warning("Numba is not installed, falling back to the exact method")
+        method = "exact"
+    percentiles = np.asarray(percentiles)
+    times = da[time_dim].values
+    freq = steps_per_day(times)
+    n_window = window_steps(window, freq, stride)
+    ext = extended_positions(times, n_window)
+    starts, offsets = window_indices(times, n_window, freq, stride, n_days)
+
+    da = da.transpose(time_dim, ...)
+    point_shape = da.shape[1:]
+    values = da.values.reshape(times.size, point_shape[0] if point_shape else 1, -1)
+    if method != "sketch":
+        chunk_size = chunk_size or _chunk_size(
+            _n_samples(starts, offsets), values.shape[1:], values.dtype.itemsize
+        )
+    shape = (n_days * freq, percentiles.size) + point_shape
+    if out is None:
+        out = np.empty(shape, dtype=values.dtype)
+    elif out.shape != shape:
+        raise ValueError(f"Output of shape {out.shape} does not match {shape}")
+    # NumPy outputs of scalar series get a point dimension as a view
+    target = out if point_shape else out.reshape(shape + (1,))
+    logger.info(
+        f"Computing {percentiles.size} percentiles for {n_days} days x {freq} "
+        f"steps and {values[0].size} points, window of {n_window} steps ({method})"
+    )
+
+    def write_block(block):
+        block_values = values[ext, block]
+        block_shape = block_values.shape[1:2] + point_shape[1:]
+        block_values = block_values.reshape(ext.size, -1)
+        for ihour in range(freq):
+            if method == "exact":
+                result = _percentile_block(
+                    block_values, starts[ihour], offsets[ihour], n_window, percentiles
+                )
+            else:
+                result = _sliding_block(
+                    block_values, starts[ihour], offsets[ihour], percentiles
+                )
+            target[ihour::freq, :, block] = result.reshape(
+                result.shape[:2] + block_shape
+            )
+
+    if method == "sketch":
+        sketches = climatology_sketch(
+            da, window, stride, n_days, time_dim, compression, chunk_size, workers
+        )
+        target[...] = sketch_percentiles(sketches, percentiles).values.reshape(
+            target.shape
+        )
+    else:
+        _map_blocks(write_block, values.shape[1], chunk_size, workers)
+
+    if not isinstance(out, np.ndarray):
+        out = dask.array.from_array(out, chunks=out.chunks)
+    return _climatology_array(out, da, percentiles, freq, n_days)
+
+
+def climatology_sketch(
+    da,
+    window=30,
+    stride=1,
+    n_days=366,
+    time_dim="time",
+    compression=100,
+    chunk_size=None,
+    workers=1,
+):
+    """
+    Build mergeable quantile sketches of the climatology samples.
+
+    Each step of the year and point gets a t-digest of the samples of its
+    window (see `hyve.sketch`). Sketches of the same steps built from
+    different years or on several nodes are combined with `merge_sketches`,
+    so climatologies can be built incrementally, year by year. Windows wrap
+    around the series, so merging sketches of single whole years pools the
+    same samples as a sketch of all years at once.
+
+    Within a block of points, years are processed in slices of about
+    ``4 * compression`` samples per step: the samples of a slice are
+    gathered, sorted and sketched, then merged into the running sketch.
+    Memory therefore scales with a slice of years rather than with the full
+    sample cube. Sketches are not faster than the exact method, and each
+    merge adds a small rank error, so this mode is meant for climatologies
+    that are built and merged incrementally; the exact method is preferred
+    for one-off climatologies.
+
+    Parameters are those of `compute_climatology`.
+
+    Returns
+    -------
+    xarray.Dataset
+        Centroid ``mean`` and ``weight`` with a "centroid" dimension, ``min``,
+        ``max`` and the number of NaN samples ``n_missing`` for each step and
+        point. The parameters are stored as attributes.
+    """
+    times = da[time_dim].values
+    freq = steps_per_day(times)
+    n_window = window_steps(window, freq, stride)
+    ext = extended_positions(times, n_window)
+    starts, offsets = window_indices(times, n_window, freq, stride, n_days)
+
+    da = da.transpose(time_dim, ...)
+    point_shape = da.shape[1:]
+    values = da.values.reshape(times.size, point_shape[0] if point_shape else 1, -1)
+    n_centroids = max(compression // 2, 1)
+    n_years = starts.shape[-1]
+    n_offsets = max(o.size for o in offsets)
+    # each slice holds enough samples per step to amortise merging its sketch
+    n_slice = min(int(np.ceil(SLICE_SAMPLES * compression / n_offsets)), n_years)
+    chunk_size = chunk_size or _chunk_size(
+        n_days * n_slice * n_offsets, values.shape[1:], values.dtype.itemsize
+    )
+    shape = (n_days * freq,) + values.shape[1:]
+    fields = {
+        "mean": np.empty(shape + (n_centroids,)),
+        "weight": np.empty(shape + (n_centroids,)),
+        "min": np.empty(shape),
+        "max": np.empty(shape),
+        "n_missing": np.empty(shape, dtype=int),
+    }
+    logger.info(
+        f"Sketching {n_days} days x {freq} steps and {values[0].size} points with "
+        f"{n_centroids} centroids, window of {n_window} steps, slices of "
+        f"{n_slice} years"
+    )
+
+    def write_block(block):
+        block_values = values[ext, block]
+        block_shape = block_values.shape[1:]
+        block_values = block_values.reshape(ext.size, -1)
+        for ihour in range(freq):
+            # each slice of years is sketched and merged into the running
+            # sketch, the samples of all years are never gathered at once
+            sketches = None
+            for year in range(0, n_years, n_slice):
+                samples = _gather_samples(
+                    block_values,
+                    starts[ihour][:, year : year + n_slice],
+                    offsets[ihour],
+                    n_window,
+                )
+                part = sketch.build(samples, compression)
+                sketches = (
+                    part
+                    if sketches is None
+                    else sketch.update(sketches, part, compression)
+                )
+            for field, result in zip(fields.values(), sketches):
+                field[ihour::freq, block] = result.reshape(
+                    result.shape[:1] + block_shape + result.shape[2:]
+                )
+
+    _map_blocks(write_block, values.shape[1], chunk_size, workers)
+
+    dims = ("time", *da.dims[1:])
+    coords = {"time": time_labels(freq, n_days)}
+    coords.update({dim: da[dim] for dim in da.dims[1:] if dim in da.coords})
+    attrs = {"compression": compression, "window": window, "stride": stride}
+    if da.name is not None:
+        attrs["variable"] = da.name
+    return xr.Dataset(
+        {
+            name: (
+                dims + ("centroid",) * (field.ndim > len(shape)),
+                field.reshape((shape[0],) + point_shape + field.shape[len(shape) :]),
+            )
+            for name, field in fields.items()
+        },
+        coords=coords,
+        attrs=attrs,
+    )
+
+
+def merge_sketches(sketches):
+    """
+    Merge climatology sketches of the same steps and points.
+
+    Parameters
+    ----------
+    sketches : list of xarray.Dataset
+        Sketches of `climatology_sketch`, e.g. of different years, built with
+        the same parameters.
+
+    Returns
+    -------
+    xarray.Dataset
+        Sketch of all the samples.
+    """
+    attrs = sketches[0].attrs
+    for other in sketches[1:]:
+        if other.attrs != attrs:
+            raise ValueError(
+                f"Cannot merge sketches with parameters {other.attrs} and {attrs}"
+            )
+    sketches = xr.align(*sketches, join="exact")
+    mean, weight = xr.apply_ufunc(
+        sketch.merge,
+        xr.concat([ds["mean"] for ds in sketches], dim="centroid"),
+        xr.concat([ds["weight"] for ds in sketches], dim="centroid"),
+        input_core_dims=[["centroid"], ["centroid"]],
+        output_core_dims=[["centroid"], ["centroid"]],
+        exclude_dims={"centroid"},
+        kwargs={"compression": attrs["compression"]},
+    )
+    stacked = xr.concat(
+        [ds[["min", "max", "n_missing"]] for ds in sketches], dim="sketch"
+    )
+    return xr.Dataset(
+        {
+            "mean": mean,
+            "weight": weight,
+            "min": stacked["min"].min("sketch"),
+            "max": stacked["max"].max("sketch"),
+            "n_missing": stacked["n_missing"].sum("sketch"),
+        },
+        attrs=attrs,
+    )
+
+
+def sketch_percentiles(sketches, percentiles):
+    """
+    Percentiles of climatology sketches, NaN where samples are missing.
+
+    Returns
+    -------
+    xarray.DataArray
+        Climatology in the layout of `compute_climatology`.
+    """
+    percentiles = np.asarray(percentiles)
+    clim = xr.apply_ufunc(
+        sketch.quantiles,
+        sketches["mean"],
+        sketches["weight"],
+        sketches["min"],
+        sketches["max"],
+        input_core_dims=[["centroid"], ["centroid"], [], []],
+        output_core_dims=[["ensemble"]],
+        kwargs={"percentiles": percentiles},
+        dask="parallelized",
+        output_dtypes=[float],
+        dask_gufunc_kwargs={"output_sizes": {"ensemble": percentiles.size}},
+    )
+    clim = clim.where(sketches["n_missing"] == 0).transpose("time", "ensemble", ...)
+    return clim.assign_coords(percentile=("ensemble", percentiles)).rename(
+        sketches.attrs.get("variable")
+    )
+
+
+def open_sketch(path):
+    """Open a climatology sketch saved as NetCDF or Zarr."""
+    if output_format({"file": path}) == "zarr":
+        return xr.open_zarr(path)
+    return xr.open_dataset(path)
+
+
+def _zarr_output(template, path):
+    import zarr
+
+    # coordinates and metadata are written now, data blocks by the workers
+    name = template.name or "clim"
+    template.to_dataset(name=name).to_zarr(path, mode="w", compute=False)
+    return name, zarr.open_group(path, mode="r+")[name]
+
+
+def _load_input(config, time_dim):
+    da, _ = load_da(config["input"], 2)
+    return da.sel({time_dim: slice(config.get("start"), config.get("end"))}).load()
+
+
+def _sketch_climatology(config, percentiles, time_dim):
+    # sketches of previous runs are merged with the sketch of the input
+    sketch_config = config["sketch"]
+    sketches = [open_sketch(path) for path in sketch_config.get("merge", [])]
+    if "input" in config:
+        sketches.append(
+            climatology_sketch(
+                _load_input(config, time_dim),
+                window=config.get("window", 30),
+                stride=config.get("stride", 1),
+                n_days=config.get("n_days", 366),
+                time_dim=time_dim,
+                compression=config.get("compression", 100),
+                chunk_size=config.get("chunk_size"),
+                workers=config.get("workers", 1),
+            )
+        )
+    if not sketches:
+        raise ValueError("A sketch climatology needs an input or sketches to merge")
+    merged = merge_sketches(sketches) if len(sketches) > 1 else sketches[0]
+    if sketch_config.get("file") is not None:
+        write_output(merged, sketch_config)
+    return sketch_percentiles(merged, percentiles)
+
+
+def climatology(config: dict[str, Any]) -> xr.DataArray:
+    """
+    Compute a percentile climatology from a YAML-style config.
+
+    The config has an ``input`` source (see `hyve.core.load_da`), optional
+    ``start``/``end`` dates, ``window``, ``stride``, ``n_days``, ``percentiles``
+    (default 0 to 100 by 10), ``chunk_size`` (default `default_chunk_size`),
+    ``method``, ``workers`` and an ``output`` (see `hyve.output.write_output`).
+    Zarr outputs are created before computing and filled in place, block by
+    block of points.
+
+    A ``sketch`` section builds the climatology from quantile sketches with a
+    ``compression``: the sketch of the input is merged with the sketch files
+    listed in ``merge`` and saved to ``file``, e.g. to add one year at a time.
+    """
+    time_dim = config.get("time_dim", "time")
+    percentiles = config.get("percentiles", np.arange(0, 101, 10))
+    output = config.get("output", {})
+    start_time = time.perf_counter()
+    in_place = False
+    if "sketch" in config:
+        clim = _sketch_climatology(config, percentiles, time_dim)
+    else:
+        da = _load_input(config, time_dim)
+        n_days = config.get("n_days", 366)
+        # zarr chunks of the output match the blocks written by the workers
+        chunk_size = config.get("chunk_size") or default_chunk_size(
+            da,
+            config.get("window", 30),
+            config.get("stride", 1),
+            n_days,
+            time_dim,
+        )
+        in_place = output.get("file") is not None and output_format(output) == "zarr"
+        out = None
+        if in_place:
+            template = climatology_template(
+                da, percentiles, n_days, time_dim, chunk_size
+            )
+            name, out = _zarr_output(template, output["file"])
+        clim = compute_climatology(
+            da,
+            percentiles,
+            window=config.get("window", 30),
+            stride=config.get("stride", 1),
+            n_days=n_days,
+            time_dim=time_dim,
+            chunk_size=chunk_size,
+            method=config.get("method", "exact"),
+            out=out,
+            workers=config.get("workers", 1),
+            compression=config.get("compression", 100),
+        )
+    logger.info(
+        f"Climatology computed in {time.perf_counter() - start_time:.2f}s, "
+        f"peak resident memory: {peak_rss_mb():.1f} MiB"
+    )
+    if in_place:
+        return xr.open_zarr(output["file"])[name]
+    if output.get("file") is not None:
+        write_output(clim.to_dataset(name=clim.name or "clim"), output)
+    return clim
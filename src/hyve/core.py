@@ -1,4 +1,21 @@
+import contextlib
+import glob
+import hashlib
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+from collections import OrderedDict
+
 import earthkit.data as ekd
+import xarray as xr
+from dask.diagnostics import ProgressBar
+
+from hyve.cache import file_hash
+
+logger = logging.getLogger(__name__)
 
 
 def find_main_var(ds, min_dim=2):
@@ -31,10 +48,230 @@ def find_main_var(ds, min_dim=2):
         return variable_names[0]
 
 
-def load_da(ds_config, n_dims):
+def find_vars(ds, min_dim=2, variables=None):
+    """
+    Find the variables to process in the dataset.
+
+    Parameters
+    ----------
+    ds : xarray.Dataset
+        The dataset to search.
+    min_dim : int, optional
+        The minimum number of dimensions the variables must have. Default is 2.
+    variables : list of str or str, optional
+        Variable names, or "all" for every data variable with the required
+        dimensions. Default is the single main variable, see `find_main_var`.
+
+    Returns
+    -------
+    list of str
+        The variable names.
+
+    Raises
+    ------
+    ValueError
+        If no matching variable is found or a requested variable is missing.
+    """
+    if variables is None:
+        return [find_main_var(ds, min_dim)]
+    if variables == "all":
+        variable_names = [k for k in ds.data_vars if len(ds[k].dims) >= min_dim]
+        if len(variable_names) == 0:
+            raise ValueError(f"No variable of dimension >= {min_dim} in dataset.")
+        return variable_names
+    if isinstance(variables, str):
+        variables = [variables]
+    missing = [k for k in variables if k not in ds.data_vars]
+    if missing:
+        raise ValueError(
+            f"Variables {missing} not found in dataset. "
+            f"Available: {list(ds.data_vars)}"
+        )
+    return list(variables)
+
+
+def _file_paths(ds_config):
+    src_name, src_config = next(iter(ds_config["source"].items()))
+    if src_name != "file":
+        return []
+    paths = src_config.get("path", [])
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    return sorted(
+        match for path in paths for match in (glob.glob(str(path)) or [str(path)])
+    )
+
+
+def source_key(ds_config, content=False):
+    """
+    Return the key identifying the dataset opened from a source config.
+
+    The key covers the source and ``to_xarray_options``. For file sources it
+    also covers the modification time and size of every file, or their
+    content hash when ``content`` is True, so that changed files are reopened.
+    """
+    files = []
+    for path in _file_paths(ds_config):
+        if not os.path.exists(path):
+            continue
+        if content:
+            files.append((path, file_hash(path)))
+        else:
+            stat = os.stat(path)
+            files.append((path, stat.st_mtime_ns, stat.st_size))
+    payload = json.dumps(
+        {
+            "source": ds_config["source"],
+            "to_xarray_options": ds_config.get("to_xarray_options", {}),
+            "files": files,
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _SourceCache:
+    """Process-level LRU cache of opened datasets."""
+
+    def __init__(self, max_entries=8, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, ds):
+        with self.lock:
+            self.entries[key] = ds
+            self.entries.move_to_end(key)
+            total = sum(entry.nbytes for entry in self.entries.values())
+            while len(self.entries) > 1 and (
+                len(self.entries) > self.max_entries
+                or (self.max_bytes is not None and total > self.max_bytes)
+            ):
+                _, evicted = self.entries.popitem(last=False)
+                total -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_source_cache = _SourceCache()
+
+
+def configure_source_cache(max_entries=8, max_bytes=None):
+    """
+    Set the eviction policy of the in-memory source cache.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        Maximum number of opened datasets kept. 0 disables the cache.
+    max_bytes : int, optional
+        Maximum total size of the cached datasets, as reported by
+        `xarray.Dataset.nbytes`.
+    """
+    _source_cache.max_entries = max_entries
+    _source_cache.max_bytes = max_bytes
+    if max_entries == 0:
+        _source_cache.clear()
+
+
+def clear_source_cache():
+    """Remove every dataset from the in-memory source cache."""
+    _source_cache.clear()
+
+
+def _decode_source(ds_config):
     src_name = list(ds_config["source"].keys())[0]
     source = ekd.from_source(src_name, **ds_config["source"][src_name])
-    ds = source.to_xarray(**ds_config.get("to_xarray_options", {}))
+    return source.to_xarray(**ds_config.get("to_xarray_options", {}))
+
+
+def _open_disk_cached(ds_config, disk_cache):
+    if isinstance(disk_cache, str):
+        disk_cache = {"dir": disk_cache}
+    fmt = disk_cache.get("format", "netcdf")
+    if fmt not in ("netcdf", "zarr"):
+        raise ValueError(f"Unsupported disk cache format '{fmt}'")
+    cache_dir = disk_cache["dir"]
+    suffix = ".zarr" if fmt == "zarr" else ".nc"
+    path = os.path.join(cache_dir, source_key(ds_config, content=True) + suffix)
+    if not os.path.exists(path):
+        logger.info(f"Decoding source into disk cache: {path}")
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = os.path.join(cache_dir, f".{os.getpid()}.{threading.get_ident()}")
+        tmp_path += suffix
+        ds = _decode_source(ds_config)
+        if fmt == "zarr":
+            ds.to_zarr(tmp_path, mode="w")
+        else:
+            ds.to_netcdf(tmp_path)
+        os.replace(tmp_path, path)
+    else:
+        logger.info(f"Loading decoded source from disk cache: {path}")
+    return xr.open_zarr(path) if fmt == "zarr" else xr.open_dataset(path)
+
+
+def _open_source(ds_config):
+    """
+    Open the dataset of a source config, reusing previously opened datasets.
+
+    Datasets are kept in a process-level LRU cache, see
+    `configure_source_cache`, unless ``ds_config["cache"]`` is False. With
+    ``ds_config["disk_cache"]`` set to a directory, or to a dict with ``dir``
+    and ``format`` ("netcdf" or "zarr"), decoded sources such as GRIB files are
+    also stored on disk and reopened on later runs instead of being decoded.
+    """
+    use_cache = ds_config.get("cache", True) and _source_cache.max_entries > 0
+    key = source_key(ds_config) if use_cache else None
+    ds = _source_cache.get(key) if use_cache else None
+    if ds is not None:
+        logger.debug(f"Source cache hit: {key}")
+        return ds.copy()
+    if ds_config.get("disk_cache"):
+        ds = _open_disk_cached(ds_config, ds_config["disk_cache"])
+    else:
+        ds = _decode_source(ds_config)
+    if use_cache:
+        _source_cache.put(key, ds)
+        ds = ds.copy()
+    return ds
+
+
+def load_ds(ds_config, n_dims):
+    """
+    Load the configured variables from a source into a single dataset.
+
+    The variables are read from ``ds_config["variables"]``, a list of names or
+    "all", defaulting to the single main variable.
+    """
+    ds = _open_source(ds_config)
+    var_names = find_vars(ds, n_dims, ds_config.get("variables"))
+    return ds[var_names], var_names
+
+
+def load_da(ds_config, n_dims):
+    ds = _open_source(ds_config)
     var_name = find_main_var(ds, n_dims)
     da = ds[var_name]
     return da, var_name
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of the current process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def progress_bar(enabled=True):
+    """Return a dask progress bar, or a no-op context when disabled."""
+    return ProgressBar(dt=15) if enabled else contextlib.nullcontext()
@@ -1,38 +1,101 @@
+import glob
 import logging
+import multiprocessing
+import os
+import string
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from typing import Any
 
 import numpy as np
 import pandas as pd
 import xarray as xr
-from dask.diagnostics import ProgressBar
 
-from hyve.core import load_da
+from hyve.cache import (
+    evict,
+    grid_fingerprint,
+    load_mapping,
+    mapping_cache_key,
+    save_mapping,
+)
+from hyve.core import load_ds, progress_bar
+from hyve.mapping import nearest_axis_index, nearest_grid_points
+from hyve.output import append_output, last_output_time, output_time_dim, write_output
 
 logger = logging.getLogger(__name__)
 
 
 def process_grid_inputs(grid_config):
-    da, var_name = load_da(grid_config, 3)
-    logger.info(f"Xarray created from source:\n{da}\n")
+    """
+    Load the grid and resolve its spatial dimensions.
+
+    Regular and curvilinear grids have two spatial dimensions, ``x`` and
+    ``y``. Unstructured grids, such as reduced Gaussian grids, have a single
+    spatial dimension, configured as ``x`` with ``y`` set to null (or to the
+    same dimension), in which case ``y_dim`` is None and ``shape`` is (n,).
+    """
     coord_config = grid_config.get("coords", {})
     x_dim = coord_config.get("x", "lat")
     y_dim = coord_config.get("y", "lon")
-    da = da.sortby([x_dim, y_dim])
-    shape = da[x_dim].shape[0], da[y_dim].shape[0]
-    return da, var_name, x_dim, y_dim, shape
+    if y_dim == x_dim:
+        y_dim = None
+    ds, var_names = load_ds(grid_config, 2 if y_dim is None else 3)
+    logger.info(f"Xarray created from source:\n{ds}\n")
+    spatial_dims = spatial_dimensions(x_dim, y_dim)
+    ds = ds.transpose(..., *spatial_dims)
+    shape = tuple(ds.sizes[dim] for dim in spatial_dims)
+    return ds, var_names, x_dim, y_dim, shape
 
 
-def construct_mask(x_indices, y_indices, shape):
-    mask = np.zeros(shape, dtype=bool)
-    mask[x_indices, y_indices] = True
+def spatial_dimensions(x_dim, y_dim):
+    """Return the spatial dimensions, a single one for unstructured grids."""
+    return (x_dim,) if y_dim is None else (x_dim, y_dim)
+
 
+def construct_mask(x_indices, y_indices, shape):
     flat_indices = np.ravel_multi_index((x_indices, y_indices), shape)
-    _, duplication_indexes = np.unique(flat_indices, return_inverse=True)
-    return mask, duplication_indexes
+    return construct_mask_from_flat(flat_indices, shape)
 
 
-def create_mask_from_index(df, shape):
-    logger.info(f"Creating mask {shape} from index")
+def construct_mask_from_flat(flat_indices, shape):
+    mask = np.zeros(int(np.prod(shape)), dtype=bool)
+    mask[flat_indices] = True
+
+    _, duplication_indexes = np.unique(flat_indices, return_inverse=True)
+    return mask.reshape(shape), duplication_indexes
+
+
+def axis_order(da, dim):
+    """
+    Return the permutation mapping sorted positions to native positions.
+
+    Station indices are defined against the grid sorted in ascending order.
+    Instead of sorting the data, which reindexes every field, indices are
+    translated into the native orientation. Returns None for axes that are
+    already ascending or have no coordinate.
+    """
+    if dim not in da.coords or da[dim].ndim != 1:
+        return None
+    values = da[dim].values
+    diff = np.diff(values)
+    if np.all(diff >= 0):
+        return None
+    if np.all(diff < 0):
+        logger.debug(f"Axis '{dim}' is descending, remapping station indices")
+        return np.arange(values.size)[::-1]
+    logger.debug(f"Axis '{dim}' is unsorted, remapping station indices")
+    return np.argsort(values, kind="stable")
+
+
+def station_indices_from_index(df, shape, x_order=None, y_order=None):
+    """
+    Return per-station flat grid indices from the x/y index columns.
+
+    ``x_order`` and ``y_order`` translate indices of the sorted grid into the
+    native orientation, see `axis_order`.
+    """
+    logger.info(f"Mapping stations onto grid {shape} from index")
     logger.debug(f"DataFrame columns: {df.columns.tolist()}")
     x_indices = df["x_index"].values
     y_indices = df["y_index"].values
@@ -47,23 +110,77 @@ def create_mask_from_index(df, shape):
             f"x_index range=({int(x_indices.min())},{int(x_indices.max())}), "
             f"y_index range=({int(y_indices.min())},{int(y_indices.max())})"
         )
-    mask, duplication_indexes = construct_mask(x_indices, y_indices, shape)
-    return mask, duplication_indexes
+    if x_order is not None:
+        x_indices = x_order[x_indices]
+    if y_order is not None:
+        y_indices = y_order[y_indices]
+    return np.ravel_multi_index((x_indices, y_indices), shape)
+
+
+def station_indices_from_index_1d(df, shape):
+    """Return per-station flat grid indices from the 1D index column."""
+    logger.info(f"Mapping stations onto grid {shape} from 1D index")
+    index_1d = df["index_1d"].values
+    size = int(np.prod(shape))
+    if np.any(index_1d < 0) or np.any(index_1d >= size):
+        raise ValueError(
+            f"Station indices out of grid bounds. Grid size={size}, "
+            f"index_1d range=({int(index_1d.min())},{int(index_1d.max())})"
+        )
+    return index_1d
 
 
-def create_mask_from_coords(df, gridx, gridy, shape):
-    logger.info(f"Creating mask {shape} from coordinates")
+def station_indices_from_coords(df, gridx, gridy, shape):
+    """
+    Return per-station flat indices of the nearest grid points.
+
+    Regular grids, given as 1D ``gridx`` and ``gridy`` axes, are matched per
+    axis with a sorted search. Curvilinear and unstructured grids, given as
+    ``gridx`` (latitude) and ``gridy`` (longitude) arrays of the grid shape,
+    are matched by great-circle distance using a KD-tree.
+    """
+    logger.info(f"Mapping stations onto grid {shape} from coordinates")
     logger.debug(f"DataFrame columns: {df.columns.tolist()}")
     station_x = df["x_coord"].values
     station_y = df["y_coord"].values
+    gridx = np.asarray(gridx)
+    gridy = np.asarray(gridy)
 
-    x_distances = np.abs(station_x[:, np.newaxis] - gridx)
-    x_indices = np.argmin(x_distances, axis=1)
-    y_distances = np.abs(station_y[:, np.newaxis] - gridy)
-    y_indices = np.argmin(y_distances, axis=1)
+    if gridx.ndim == 1 and gridy.ndim == 1 and shape == (gridx.size, gridy.size):
+        x_indices = nearest_axis_index(station_x, gridx)
+        y_indices = nearest_axis_index(station_y, gridy)
+        return np.ravel_multi_index((x_indices, y_indices), shape)
 
-    mask, duplication_indexes = construct_mask(x_indices, y_indices, shape)
-    return mask, duplication_indexes
+    if gridx.shape != tuple(shape) or gridy.shape != tuple(shape):
+        raise ValueError(
+            f"Grid coordinates of shape {gridx.shape} and {gridy.shape} do not "
+            f"match grid shape {shape}"
+        )
+    distances, flat_indices = nearest_grid_points(station_x, station_y, gridx, gridy)
+    logger.debug(f"Maximum station to grid point distance: {distances.max():.3f} km")
+    return flat_indices
+
+
+def create_mask_from_index(df, shape):
+    """
+    Return the grid mask and duplication indexes of stations given by index.
+
+    Kept as public API for callers of the mask contract; extraction itself
+    uses `station_indices_from_index`.
+    """
+    return construct_mask_from_flat(station_indices_from_index(df, shape), shape)
+
+
+def create_mask_from_coords(df, gridx, gridy, shape):
+    """
+    Return the grid mask and duplication indexes of stations given by coords.
+
+    Kept as public API for callers of the mask contract; extraction itself
+    uses `station_indices_from_coords`.
+    """
+    return construct_mask_from_flat(
+        station_indices_from_coords(df, gridx, gridy, shape), shape
+    )
 
 
 def parse_stations(station_config: dict[str, Any]) -> pd.DataFrame:
@@ -138,20 +255,55 @@ def parse_stations(station_config: dict[str, Any]) -> pd.DataFrame:
     return df_renamed
 
 
-def _process_gribjump(grid_config: dict[str, Any], df: pd.DataFrame) -> xr.Dataset:
-    if "index_1d" not in df.columns:
-        raise ValueError("Gribjump source requires 'index_1d' in station config.")
-
-    station_names = df["station_name"].values
-    unique_indices, duplication_indexes = np.unique(
-        df["index_1d"].values, return_inverse=True
-    )  # type: ignore[call-overload]
-
-    # Converting indices to ranges is currently faster than using indices
-    # directly. This is a problem in the earthkit-data gribjump source and will
-    # be fixed there.
-    ranges = [(i, i + 1) for i in unique_indices]
-
+def _station_names(df: pd.DataFrame) -> np.ndarray:
+    # pandas string dtypes become fixed-width unicode so that stores written
+    # and appended to in different runs agree on the station dtype
+    names = df["station_name"]
+    if pd.api.types.is_string_dtype(names):
+        return names.to_numpy(dtype=str)
+    return names.to_numpy()
+
+
+def coalesce_ranges(indices: np.ndarray) -> list[tuple[int, int]]:
+    """Merge sorted unique indices into half-open ranges of adjacent indices."""
+    if len(indices) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = indices[np.concatenate(([0], breaks))]
+    ends = indices[np.concatenate((breaks - 1, [len(indices) - 1]))] + 1
+    return [(int(start), int(end)) for start, end in zip(starts, ends)]
+
+
+def batch_ranges(
+    ranges: list[tuple[int, int]], batch_size: int | None
+) -> list[list[tuple[int, int]]]:
+    """
+    Split ranges into batches of at most ``batch_size`` points.
+
+    Ranges longer than the batch size are split across batches. Batches keep
+    the input order, so concatenating their results restores it.
+    """
+    if batch_size is None:
+        return [ranges]
+    if batch_size < 1:
+        raise ValueError(f"Batch size must be at least 1, got {batch_size}")
+    batches = [[]]
+    n_points = 0
+    for start, end in ranges:
+        while start < end:
+            if n_points == batch_size:
+                batches.append([])
+                n_points = 0
+            stop = min(end, start + batch_size - n_points)
+            batches[-1].append((start, stop))
+            n_points += stop - start
+            start = stop
+    return batches
+
+
+def _load_gribjump_batch(
+    grid_config: dict[str, Any], ranges: list[tuple[int, int]]
+) -> xr.Dataset:
     gribjump_config = {
         "source": {
             "gribjump": {
@@ -163,77 +315,428 @@ def _process_gribjump(grid_config: dict[str, Any], df: pd.DataFrame) -> xr.Datas
             }
         },
         "to_xarray_options": grid_config.get("to_xarray_options", {}),
+        "variables": grid_config.get("variables"),
+        # each batch is fetched once, caching would only evict useful entries
+        "cache": False,
     }
+    n_points = sum(end - start for start, end in ranges)
+    start_time = time.perf_counter()
+    ds, _ = load_ds(gribjump_config, 2)
+    elapsed = time.perf_counter() - start_time
+    logger.info(
+        f"Gribjump batch of {n_points} points in {len(ranges)} ranges: "
+        f"{elapsed:.2f}s ({n_points / max(elapsed, 1e-9):.0f} points/s)"
+    )
+    return ds
+
+
+def _process_gribjump(
+    grid_config: dict[str, Any],
+    df: pd.DataFrame,
+    sel: dict[str, Any] | None = None,
+) -> xr.Dataset:
+    if "index_1d" not in df.columns:
+        raise ValueError("Gribjump source requires 'index_1d' in station config.")
 
-    masked_da, var_name = load_da(gribjump_config, 2)
+    station_names = _station_names(df)
+    unique_indices, duplication_indexes = np.unique(
+        df["index_1d"].values, return_inverse=True
+    )  # type: ignore[call-overload]
+
+    # Requesting ranges is currently faster than using indices directly, so
+    # adjacent indices are coalesced into contiguous ranges.
+    batch_config = grid_config.get("gribjump_batch", {})
+    batches = batch_ranges(
+        coalesce_ranges(unique_indices), batch_config.get("size", None)
+    )
+    workers = batch_config.get("workers", 1)
+    logger.info(
+        f"Fetching {len(unique_indices)} points from gribjump in "
+        f"{len(batches)} batches with {workers} workers"
+    )
 
-    ds = xr.Dataset({var_name: masked_da})
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(
+                lambda ranges: _load_gribjump_batch(grid_config, ranges), batches
+            )
+        )
+    elapsed = time.perf_counter() - start_time
+    logger.info(
+        f"Gribjump fetch of {len(unique_indices)} points: {elapsed:.2f}s "
+        f"({len(unique_indices) / max(elapsed, 1e-9):.0f} points/s)"
+    )
+
+    ds = results[0] if len(results) == 1 else xr.concat(results, dim="index")
+    if sel is not None:
+        ds = ds.sel(sel)
     ds = ds.isel(index=duplication_indexes)
     ds = ds.rename({"index": "station"})
     ds["station"] = station_names
     return ds
 
 
-def _process_regular(grid_config: dict[str, Any], df: pd.DataFrame) -> xr.Dataset:
-    station_names = df["station_name"].values
-    da, var_name, x_dim, y_dim, shape = process_grid_inputs(grid_config)
-
+def _station_indices(
+    grid_config: dict[str, Any],
+    df: pd.DataFrame,
+    ds: xr.Dataset,
+    x_dim: str,
+    y_dim: str | None,
+    shape: tuple[int, ...],
+) -> np.ndarray:
     use_index = "x_index" in df.columns and "y_index" in df.columns
 
+    if "index_1d" in df.columns:
+        return station_indices_from_index_1d(df, shape)
     if use_index:
-        mask, duplication_indexes = create_mask_from_index(df, shape)
+        if len(shape) != 2:
+            raise ValueError(
+                "Station x/y indices require a grid with two spatial dimensions. "
+                "Use 'index_1d' or 'coords' for unstructured grids."
+            )
+        return station_indices_from_index(
+            df, shape, axis_order(ds, x_dim), axis_order(ds, y_dim)
+        )
+
+    gridx, gridy = _grid_coords(grid_config, ds, x_dim, y_dim)
+    return station_indices_from_coords(df, gridx, gridy, shape)
+
+
+def _grid_coords(grid_config, ds, x_dim, y_dim):
+    coord_config = grid_config.get("coords", {})
+    if y_dim is None:
+        names = (
+            coord_config.get("lat", "latitude"),
+            coord_config.get("lon", "longitude"),
+        )
     else:
-        mask, duplication_indexes = create_mask_from_coords(
-            df, da[x_dim].values, da[y_dim].values, shape
+        names = (coord_config.get("lat", x_dim), coord_config.get("lon", y_dim))
+    spatial_dims = spatial_dimensions(x_dim, y_dim)
+    coords = []
+    for name in names:
+        coord = ds[name]
+        coords.append(
+            coord.transpose(*[d for d in spatial_dims if d in coord.dims]).values
         )
+    return tuple(coords)
 
-    logger.info("Extracting timeseries at selected stations")
-    masked_da = apply_mask(da, mask, x_dim, y_dim)
 
-    ds = xr.Dataset({var_name: masked_da})
-    ds = ds.isel(index=duplication_indexes)
-    ds = ds.rename({"index": "station"})
+def _grid_fingerprint(grid_config, ds, x_dim, y_dim, shape):
+    return grid_fingerprint(
+        np.asarray(shape), *_grid_coords(grid_config, ds, x_dim, y_dim)
+    )
+
+
+def _station_indices_cached(
+    cache_config: dict[str, Any],
+    station_config: dict[str, Any],
+    grid_config: dict[str, Any],
+    df: pd.DataFrame,
+    ds: xr.Dataset,
+    x_dim: str,
+    y_dim: str | None,
+    shape: tuple[int, ...],
+) -> np.ndarray:
+    cache_dir = cache_config["dir"]
+    fingerprint = _grid_fingerprint(grid_config, ds, x_dim, y_dim, shape)
+    key = mapping_cache_key(station_config, fingerprint)
+
+    mapping = load_mapping(cache_dir, key)
+    if mapping is not None:
+        return mapping["index_1d"]
+
+    index_1d = _station_indices(grid_config, df, ds, x_dim, y_dim, shape)
+    _, duplication_indexes = np.unique(index_1d, return_inverse=True)
+    grid_indices = dict(zip(("x_index", "y_index"), np.unravel_index(index_1d, shape)))
+    save_mapping(
+        cache_dir,
+        key,
+        **grid_indices,
+        index_1d=index_1d,
+        duplication_indexes=duplication_indexes,
+        shape=np.asarray(shape),
+    )
+    evict(cache_dir, cache_config.get("max_bytes"), cache_config.get("max_age"))
+    return index_1d
+
+
+def _process_regular(
+    grid_config: dict[str, Any],
+    df: pd.DataFrame,
+    station_config: dict[str, Any] | None = None,
+    cache_config: dict[str, Any] | None = None,
+    chunks: dict[str, Any] | None = None,
+    mappings: dict[str, np.ndarray] | None = None,
+    progress: bool = True,
+    sel: dict[str, Any] | None = None,
+) -> xr.Dataset:
+    station_names = _station_names(df)
+    grid_ds, var_names, x_dim, y_dim, shape = process_grid_inputs(grid_config)
+    if sel is not None:
+        # selecting before the gather keeps unselected steps unread
+        grid_ds = grid_ds.sel(sel)
+
+    # mappings memoises station indices per grid geometry across batch inputs
+    fingerprint = None
+    if mappings is not None:
+        fingerprint = _grid_fingerprint(grid_config, grid_ds, x_dim, y_dim, shape)
+    if mappings is not None and fingerprint in mappings:
+        logger.debug("Reusing station mapping for identical grid geometry")
+        index_1d = mappings[fingerprint]
+    elif cache_config is not None and station_config is not None:
+        index_1d = _station_indices_cached(
+            cache_config, station_config, grid_config, df, grid_ds, x_dim, y_dim, shape
+        )
+    else:
+        index_1d = _station_indices(grid_config, df, grid_ds, x_dim, y_dim, shape)
+    if mappings is not None:
+        mappings[fingerprint] = index_1d
+
+    if chunks is not None:
+        grid_ds = grid_ds.chunk(streaming_chunks(grid_ds, x_dim, y_dim, chunks))
+        logger.info(
+            f"Extracting timeseries lazily with chunks {dict(grid_ds.chunksizes)}"
+        )
+    else:
+        logger.info(f"Extracting timeseries of {var_names} at selected stations")
+    ds = extract_points(
+        grid_ds,
+        index_1d,
+        x_dim,
+        y_dim,
+        shape,
+        compute=chunks is None,
+        progress=progress,
+    )
     ds["station"] = station_names
     return ds
 
 
 def process_inputs(
-    station_config: dict[str, Any], grid_config: dict[str, Any]
+    station_config: dict[str, Any],
+    grid_config: dict[str, Any],
+    cache_config: dict[str, Any] | None = None,
+    chunks: dict[str, Any] | None = None,
+    sel: dict[str, Any] | None = None,
 ) -> xr.Dataset:
     df = parse_stations(station_config)
     if "gribjump" in grid_config.get("source", {}):
-        return _process_gribjump(grid_config, df)
-    return _process_regular(grid_config, df)
-
-
-def mask_array_np(arr: np.ndarray, mask: np.ndarray) -> np.ndarray:
-    return arr[..., mask]
-
-
-def apply_mask(
-    da: xr.DataArray, mask: np.ndarray, coordx: str, coordy: str
-) -> xr.DataArray:
-    task = xr.apply_ufunc(
-        mask_array_np,
-        da,
-        mask,
-        input_core_dims=[(coordx, coordy), (coordx, coordy)],
-        output_core_dims=[["index"]],
-        output_dtypes=[da.dtype],
-        exclude_dims={coordx, coordy},
-        dask="parallelized",
-        dask_gufunc_kwargs={
-            "output_sizes": {"index": int(mask.sum())},
-            "allow_rechunk": True,
-        },
+        return _process_gribjump(grid_config, df, sel)
+    return _process_regular(
+        grid_config, df, station_config, cache_config, chunks, sel=sel
+    )
+
+
+def expand_sources(sources: str | list[str]) -> list[str]:
+    """Expand a path, glob pattern or list of them into sorted unique paths."""
+    if isinstance(sources, str):
+        sources = [sources]
+    paths = []
+    for pattern in sources:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise ValueError(f"No grid source found matching '{pattern}'")
+        paths.extend(matches)
+    return list(dict.fromkeys(paths))
+
+
+def _source_config(grid_config: dict[str, Any], path: str) -> dict[str, Any]:
+    src_name = list(grid_config["source"].keys())[0]
+    return {
+        **grid_config,
+        "source": {src_name: {**grid_config["source"][src_name], "path": path}},
+    }
+
+
+def _extract_source(
+    config: dict[str, Any],
+    df: pd.DataFrame,
+    path: str,
+    index: int,
+    mappings: dict[str, np.ndarray],
+) -> xr.Dataset | str:
+    # dask progress bars register global callbacks, so they are disabled for
+    # the concurrent extractions. Outputs written per source are returned as
+    # paths, so that extracted data is neither kept until all sources are
+    # done nor sent back from worker processes.
+    start_time = time.perf_counter()
+    ds = _process_regular(
+        _source_config(config["grid"], path),
+        df,
+        config["station"],
+        config.get("cache"),
+        _output_chunks(config.get("output")),
+        mappings=mappings,
+        progress=False,
+    )
+    output_config = config.get("output")
+    if output_config is not None and config["batch"].get("concat_dim") is None:
+        output_file = output_config["file"].format(
+            index=index, stem=os.path.splitext(os.path.basename(path))[0]
+        )
+        write_output(ds, {**output_config, "file": output_file}, progress=False)
+        ds = output_file
+    logger.info(f"Extracted {path} in {time.perf_counter() - start_time:.2f}s")
+    return ds
+
+
+def batch_extractor(
+    config: dict[str, Any],
+) -> xr.Dataset | list[xr.Dataset] | list[str]:
+    """
+    Extract timeseries from many grid sources sharing one station list.
+
+    The ``batch`` config lists the grid sources (paths or glob patterns), each
+    substituted as the ``path`` of the grid source. Stations are parsed once
+    and the station mapping is reused for every source with the same grid
+    geometry. Sources are processed concurrently in a thread or process pool.
+
+    Without ``concat_dim``, one output is written per source, with ``{stem}``
+    and ``{index}`` placeholders in the output file name, and the list of
+    written files is returned, or the list of datasets if there is no
+    output. With ``concat_dim``, the results are concatenated along that new
+    dimension, labelled by source file stem, into one output.
+    """
+    batch_config = config["batch"]
+    if "gribjump" in config["grid"].get("source", {}):
+        raise ValueError("Batch extraction does not support gribjump sources.")
+    paths = expand_sources(batch_config["sources"])
+    concat_dim = batch_config.get("concat_dim")
+    output_config = config.get("output")
+    if output_config is not None and concat_dim is None and len(paths) > 1:
+        fields = {
+            name for _, name, _, _ in string.Formatter().parse(output_config["file"])
+        }
+        if not fields & {"stem", "index"}:
+            raise ValueError(
+                "Batch output file must contain an '{stem}' or '{index}' placeholder "
+                "unless 'concat_dim' is set."
+            )
+
+    df = parse_stations(config["station"])
+    workers = batch_config.get("workers", 1)
+    executor_name = batch_config.get("executor", "thread")
+    if executor_name == "thread":
+        executor_class = ThreadPoolExecutor
+    elif executor_name == "process":
+        # forking after dask has started threads can deadlock, so workers are
+        # spawned instead
+        executor_class = partial(
+            ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")
+        )
+    else:
+        raise ValueError(f"Unsupported batch executor '{executor_name}'")
+    logger.info(
+        f"Extracting {len(paths)} sources with {workers} {executor_name} workers"
     )
-    with ProgressBar(dt=15):
+
+    # the first source resolves the station mapping that the others reuse
+    mappings = {}
+    results = [_extract_source(config, df, paths[0], 0, mappings)]
+    with executor_class(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_extract_source, config, df, path, index, mappings)
+            for index, path in enumerate(paths[1:], start=1)
+        ]
+        results.extend(future.result() for future in futures)
+
+    if concat_dim is None:
+        return results
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    ds = xr.concat(results, dim=pd.Index(stems, name=concat_dim))
+    if output_config is not None:
+        write_output(ds, output_config)
+    return ds
+
+
+def streaming_chunks(
+    da: xr.DataArray | xr.Dataset,
+    coordx: str,
+    coordy: str | None,
+    chunks: dict[str, Any],
+) -> dict[str, Any]:
+    """
+    Chunking for streaming extraction.
+
+    Non-spatial dimensions default to dask's automatic chunk size so that
+    memory scales with the chunk rather than the record length. Spatial
+    dimensions are kept whole unless configured otherwise, as most sources
+    decode a full field at a time.
+    """
+    spatial_dims = spatial_dimensions(coordx, coordy)
+    default = {dim: "auto" for dim in da.dims if dim not in spatial_dims}
+    return {**default, **{dim: -1 for dim in spatial_dims}, **chunks}
+
+
+def extract_points(
+    da: xr.DataArray | xr.Dataset,
+    index_1d: np.ndarray,
+    coordx: str,
+    coordy: str | None,
+    shape: tuple[int, ...],
+    compute: bool = True,
+    progress: bool = True,
+) -> xr.DataArray | xr.Dataset:
+    """
+    Gather station timeseries by flat grid index.
+
+    The spatial dimensions are replaced by a ``station`` dimension in station
+    order, duplicates included. Vectorised indexing gathers points directly,
+    so dask arrays only read the spatial blocks that contain stations and
+    are never rechunked across the grid. All variables of a dataset are
+    gathered with the same indexers and computed together.
+    """
+    indices = np.unravel_index(index_1d, shape)
+    task = da.isel(
+        {
+            dim: xr.DataArray(dim_indices, dims="station")
+            for dim, dim_indices in zip(spatial_dimensions(coordx, coordy), indices)
+        }
+    )
+    task = task.drop_vars(
+        [name for name, coord in task.coords.items() if "station" in coord.dims]
+    )
+    if not compute:
+        return task
+    with progress_bar(progress):
         return task.compute()
 
 
-def extractor(config: dict[str, Any]) -> xr.Dataset:
-    ds = process_inputs(config["station"], config["grid"])
-    if config.get("output", None) is not None:
-        logger.info(f"Saving output to {config['output']['file']}")
-        ds.to_netcdf(config["output"]["file"])
+def _output_chunks(output_config: dict[str, Any] | None) -> dict[str, Any] | None:
+    if output_config is not None and output_config.get("streaming", False):
+        return output_config.get("chunks", {})
+    return None
+
+
+def extractor(config: dict[str, Any]) -> xr.Dataset | list[xr.Dataset] | list[str]:
+    if "batch" in config:
+        return batch_extractor(config)
+    output_config = config.get("output", None)
+    chunks = _output_chunks(output_config)
+
+    last_time = None
+    if output_config is not None and output_config.get("append", False):
+        last_time = last_output_time(output_config)
+    if last_time is None:
+        ds = process_inputs(
+            config["station"], config["grid"], config.get("cache"), chunks
+        )
+        if output_config is not None:
+            write_output(ds, output_config)
+        return ds
+
+    time_dim = output_time_dim(output_config)
+    logger.info(f"Existing output ends at {last_time}, loading later steps only")
+    ds = process_inputs(
+        config["station"],
+        config["grid"],
+        config.get("cache"),
+        chunks,
+        sel={time_dim: slice(last_time + np.timedelta64(1, "ns"), None)},
+    )
+    if ds.sizes[time_dim] == 0:
+        logger.info("No new time steps to append")
+    else:
+        append_output(ds, output_config)
     return ds
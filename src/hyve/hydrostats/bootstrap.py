@@ -0,0 +1,119 @@
+import logging
+
+import numpy as np
+import xarray as xr
+
+from hyve.hydrostats.moments import MOMENT_STATS, accumulate, derive, from_sums, to_sums
+
+logger = logging.getLogger(__name__)
+
+
+def block_bootstrap_counts(n_blocks, n_resamples, seed=None):
+    """
+    Draw block bootstrap resamples as counts of each block.
+
+    Every resample draws ``n_blocks`` blocks with replacement, so that it has
+    the length of the original series.
+
+    Returns
+    -------
+    numpy.ndarray
+        Number of times each block is drawn, shape (n_resamples, n_blocks).
+    """
+    rng = np.random.default_rng(seed)
+    draws = rng.integers(0, n_blocks, size=(n_resamples, n_blocks))
+    counts = np.zeros((n_resamples, n_blocks))
+    np.add.at(counts, (np.arange(n_resamples)[:, None], draws), 1)
+    return counts
+
+
+def block_accumulators(sim_da, obs_da, time_name, block_length, backend=None):
+    """
+    Accumulate non-overlapping blocks of ``block_length`` time steps.
+
+    The time axis is NaN-padded to a whole number of blocks and reshaped to
+    (block, step), so all blocks are accumulated in a single kernel call.
+    Padding does not change the statistics as NaNs are skipped.
+    """
+    pad = -sim_da.sizes[time_name] % block_length
+    blocks = []
+    for da in (sim_da, obs_da):
+        da = da.astype(float).drop_vars(time_name, errors="ignore")
+        da = da.pad({time_name: (0, pad)}, constant_values=np.nan)
+        blocks.append(
+            da.coarsen({time_name: block_length}).construct(
+                {time_name: ("block", "step")}
+            )
+        )
+    return accumulate(*blocks, "step", backend)
+
+
+def bootstrap_stats(
+    sim_da,
+    obs_da,
+    time_name,
+    stats,
+    n_resamples=1000,
+    block_length=30,
+    seed=None,
+    quantiles=(0.05, 0.95),
+    backend=None,
+):
+    """
+    Estimate confidence intervals of statistics by block bootstrap.
+
+    The series are split into non-overlapping blocks of time steps, which
+    preserves autocorrelation within blocks, and each block is accumulated
+    once. The resample counts are drawn once for all stations, and the
+    accumulators of every resample are obtained for all stations at once as a
+    matrix product of the counts with the per-block power sums.
+
+    Parameters
+    ----------
+    sim_da, obs_da : xarray.DataArray
+        Aligned simulation and observation arrays.
+    time_name : str
+        Name of the time dimension to resample.
+    stats : list of str
+        Names of statistics, see `hyve.hydrostats.moments.MOMENT_STATS`.
+    n_resamples : int, optional
+        Number of bootstrap resamples. Default is 1000.
+    block_length : int, optional
+        Number of time steps per block. Default is 30.
+    seed : int, optional
+        Seed of the random generator, for reproducible intervals.
+    quantiles : sequence of float, optional
+        Quantiles of the bootstrap distribution to return.
+    backend : str, optional
+        Kernel backend, "numba" or "numpy".
+
+    Returns
+    -------
+    dict of str to xarray.DataArray
+        ``{stat}_ci`` for each statistic, with a ``quantile`` dimension.
+    """
+    unsupported = [stat for stat in stats if stat not in MOMENT_STATS]
+    if unsupported:
+        raise ValueError(f"Statistics {unsupported} are not supported with bootstrap")
+    if block_length < 1 or n_resamples < 1:
+        raise ValueError("Bootstrap block_length and n_resamples must be at least 1")
+    acc = block_accumulators(sim_da, obs_da, time_name, block_length, backend)
+    n_blocks = acc.sizes["block"]
+    logger.info(
+        f"Bootstrapping {n_resamples} resamples of {n_blocks} blocks of "
+        f"{block_length} time steps"
+    )
+    sums, shifts = to_sums(acc, "block")
+    counts = xr.DataArray(
+        block_bootstrap_counts(n_blocks, n_resamples, seed),
+        dims=("resample", "block"),
+    )
+    resampled = from_sums(
+        sums.map(lambda var: xr.dot(counts, var, dim="block")), shifts
+    )
+    return {
+        f"{stat}_ci": derive(resampled, stat).quantile(
+            quantiles, dim="resample", skipna=True
+        )
+        for stat in stats
+    }
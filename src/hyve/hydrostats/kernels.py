@@ -0,0 +1,192 @@
+import logging
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # numba is an optional dependency
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+# Number of accumulated fields, in the order of `hyve.hydrostats.moments.FIELDS`.
+N_FIELDS = 15
+
+
+def _centred_moments(x, valid):
+    n = valid.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(valid, x, 0.0).sum(axis=-1) / n
+    dev = np.where(valid, x - mean[..., None], 0.0)
+    return n, mean, dev
+
+
+def accumulate_numpy(sim, obs):
+    """
+    Accumulate all sufficient statistics over the last axis with NumPy.
+
+    Parameters
+    ----------
+    sim, obs : numpy.ndarray
+        Arrays of the same shape with time as the last axis.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape ``sim.shape[:-1] + (N_FIELDS,)``.
+    """
+    sim = np.asarray(sim, dtype=float)
+    obs = np.asarray(obs, dtype=float)
+    sim_valid = ~np.isnan(sim)
+    obs_valid = ~np.isnan(obs)
+    pair_valid = sim_valid & obs_valid
+
+    pair_n, pair_sim_mean, pair_sim_dev = _centred_moments(sim, pair_valid)
+    _, pair_obs_mean, pair_obs_dev = _centred_moments(obs, pair_valid)
+    err = np.where(pair_valid, sim - obs, 0.0)
+    sim_n, sim_mean, sim_dev = _centred_moments(sim, sim_valid)
+    obs_n, obs_mean, obs_dev = _centred_moments(obs, obs_valid)
+
+    return np.stack(
+        [
+            pair_n,
+            pair_sim_mean,
+            pair_obs_mean,
+            (pair_sim_dev**2).sum(axis=-1),
+            (pair_obs_dev**2).sum(axis=-1),
+            (pair_sim_dev * pair_obs_dev).sum(axis=-1),
+            (err**2).sum(axis=-1),
+            np.abs(err).sum(axis=-1),
+            sim_n,
+            sim_mean,
+            (sim_dev**2).sum(axis=-1),
+            obs_n,
+            obs_mean,
+            (obs_dev**2).sum(axis=-1),
+            np.abs(np.where(obs_valid, obs, 0.0)).sum(axis=-1),
+        ],
+        axis=-1,
+    )
+
+
+def index_agreement_numpy(sim, obs, obs_mean):
+    """Denominator of the index of agreement over the last axis with NumPy."""
+    obs_mean = np.asarray(obs_mean)[..., None]
+    terms = (np.abs(sim - obs_mean) + np.abs(obs - obs_mean)) ** 2
+    return np.nansum(terms, axis=-1)
+
+
+def _accumulate_loop(sim, obs, _, out):
+    # Welford updates of every field in a single loop over time
+    pair_n = sim_n = obs_n = 0
+    pair_sim_mean = pair_obs_mean = sim_mean = obs_mean = 0.0
+    pair_sim_m2 = pair_obs_m2 = pair_cov = sim_m2 = obs_m2 = 0.0
+    pair_sse = pair_sae = obs_abs_sum = 0.0
+    for t in range(sim.shape[0]):
+        s = sim[t]
+        o = obs[t]
+        s_valid = not math.isnan(s)
+        o_valid = not math.isnan(o)
+        if s_valid:
+            sim_n += 1
+            delta = s - sim_mean
+            sim_mean += delta / sim_n
+            sim_m2 += delta * (s - sim_mean)
+        if o_valid:
+            obs_n += 1
+            delta = o - obs_mean
+            obs_mean += delta / obs_n
+            obs_m2 += delta * (o - obs_mean)
+            obs_abs_sum += abs(o)
+        if s_valid and o_valid:
+            pair_n += 1
+            delta_s = s - pair_sim_mean
+            delta_o = o - pair_obs_mean
+            pair_sim_mean += delta_s / pair_n
+            pair_obs_mean += delta_o / pair_n
+            pair_sim_m2 += delta_s * (s - pair_sim_mean)
+            pair_obs_m2 += delta_o * (o - pair_obs_mean)
+            pair_cov += delta_s * (o - pair_obs_mean)
+            err = s - o
+            pair_sse += err * err
+            pair_sae += abs(err)
+    out[0] = pair_n
+    out[1] = pair_sim_mean if pair_n > 0 else np.nan
+    out[2] = pair_obs_mean if pair_n > 0 else np.nan
+    out[3] = pair_sim_m2
+    out[4] = pair_obs_m2
+    out[5] = pair_cov
+    out[6] = pair_sse
+    out[7] = pair_sae
+    out[8] = sim_n
+    out[9] = sim_mean if sim_n > 0 else np.nan
+    out[10] = sim_m2
+    out[11] = obs_n
+    out[12] = obs_mean if obs_n > 0 else np.nan
+    out[13] = obs_m2
+    out[14] = obs_abs_sum
+
+
+def _index_agreement_loop(sim, obs, obs_mean, out):
+    total = 0.0
+    for t in range(sim.shape[0]):
+        term = abs(sim[t] - obs_mean[0]) + abs(obs[t] - obs_mean[0])
+        if not math.isnan(term):
+            total += term * term
+    out[0] = total
+
+
+if numba is not None:
+    # the dummy third argument carries the size of the output core dimension
+    _accumulate_gufunc = numba.guvectorize(
+        ["void(float64[:], float64[:], float64[:], float64[:])"],
+        "(t),(t),(m)->(m)",
+        nopython=True,
+        cache=True,
+    )(_accumulate_loop)
+    _index_agreement_gufunc = numba.guvectorize(
+        ["void(float64[:], float64[:], float64[:], float64[:])"],
+        "(t),(t),()->()",
+        nopython=True,
+        cache=True,
+    )(_index_agreement_loop)
+
+
+def accumulate_numba(sim, obs):
+    """Same as `accumulate_numpy`, as a compiled Numba gufunc."""
+    sim = np.asarray(sim, dtype=float)
+    obs = np.asarray(obs, dtype=float)
+    return _accumulate_gufunc(sim, obs, np.empty(N_FIELDS))
+
+
+def index_agreement_numba(sim, obs, obs_mean):
+    """Same as `index_agreement_numpy`, as a compiled Numba gufunc."""
+    sim = np.asarray(sim, dtype=float)
+    obs = np.asarray(obs, dtype=float)
+    return _index_agreement_gufunc(sim, obs, np.asarray(obs_mean, dtype=float))
+
+
+BACKENDS = {
+    "numpy": (accumulate_numpy, index_agreement_numpy),
+    "numba": (accumulate_numba, index_agreement_numba),
+}
+
+
+def get_backend(name=None):
+    """
+    Return the accumulation and index of agreement kernels of a backend.
+
+    Defaults to "numba" when Numba is installed and falls back to "numpy"
+    otherwise.
+    """
+    if name is None:
+        name = "numba" if numba is not None else "numpy"
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown statistics backend '{name}', expected one of {list(BACKENDS)}"
+        )
+    if name == "numba" and numba is None:
+        logger.warning("Numba is not installed, falling back to the numpy backend")
+        name = "numpy"
+    return BACKENDS[name]
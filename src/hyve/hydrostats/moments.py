@@ -0,0 +1,455 @@
+import logging
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hyve.hydrostats.kernels import get_backend
+
+logger = logging.getLogger(__name__)
+
+# Sufficient statistics accumulated per station. "pair_*" fields use the time
+# steps where both sim and obs are valid, "sim_*" and "obs_*" fields use every
+# valid step of that series, mirroring the skipna semantics of
+# `hyve.hydrostats.stats`. Means and centred second moments (m2, cov) are
+# kept instead of raw power sums for numerical stability and so that
+# accumulators can be merged (Chan et al., 1979).
+FIELDS = [
+    "pair_n",
+    "pair_sim_mean",
+    "pair_obs_mean",
+    "pair_sim_m2",
+    "pair_obs_m2",
+    "pair_cov",
+    "pair_sse",
+    "pair_sae",
+    "sim_n",
+    "sim_mean",
+    "sim_m2",
+    "obs_n",
+    "obs_mean",
+    "obs_m2",
+    "obs_abs_sum",
+]
+
+MOMENT_STATS = [
+    "bias",
+    "mae",
+    "mape",
+    "mse",
+    "rmse",
+    "br",
+    "vr",
+    "pc_bias",
+    "correlation",
+    "kge",
+    "nse",
+]
+# index_agreement needs |sim - mean(obs)| and |obs - mean(obs)|, which are not
+# functions of the moments, so it takes a second pass once mean(obs) is known.
+SECOND_PASS_STATS = ["index_agreement"]
+FUSED_STATS = MOMENT_STATS + SECOND_PASS_STATS
+
+# For merging: each count with the means it weighs and the centred co-moments
+# of pairs of those means, e.g. pair_cov is the co-moment of the pair means.
+MERGE_GROUPS = {
+    "pair_n": (
+        ["pair_sim_mean", "pair_obs_mean"],
+        {
+            "pair_sim_m2": ("pair_sim_mean", "pair_sim_mean"),
+            "pair_obs_m2": ("pair_obs_mean", "pair_obs_mean"),
+            "pair_cov": ("pair_sim_mean", "pair_obs_mean"),
+        },
+    ),
+    "sim_n": (["sim_mean"], {"sim_m2": ("sim_mean", "sim_mean")}),
+    "obs_n": (["obs_mean"], {"obs_m2": ("obs_mean", "obs_mean")}),
+}
+ADDITIVE_FIELDS = ["pair_sse", "pair_sae", "obs_abs_sum"]
+
+
+def _to_dataset(stacked):
+    return xr.Dataset(
+        {field: stacked.isel(moment=i, drop=True) for i, field in enumerate(FIELDS)}
+    )
+
+
+def accumulate(sim_da, obs_da, time_name, backend=None):
+    """
+    Accumulate the sufficient statistics of sim and obs over time.
+
+    Parameters
+    ----------
+    sim_da, obs_da : xarray.DataArray
+        Aligned simulation and observation arrays.
+    time_name : str
+        Name of the time dimension to reduce.
+    backend : str, optional
+        Kernel backend, "numba" or "numpy", see
+        `hyve.hydrostats.kernels.get_backend`.
+
+    Returns
+    -------
+    xarray.Dataset
+        One variable per entry of `FIELDS`, without the time dimension.
+    """
+    accumulate_kernel, _ = get_backend(backend)
+    stacked = xr.apply_ufunc(
+        accumulate_kernel,
+        sim_da,
+        obs_da,
+        input_core_dims=[[time_name], [time_name]],
+        output_core_dims=[["moment"]],
+        dask="parallelized",
+        output_dtypes=[float],
+        dask_gufunc_kwargs={"output_sizes": {"moment": len(FIELDS)}},
+    )
+    return _to_dataset(stacked)
+
+
+def merge(acc_a, acc_b):
+    """
+    Merge the accumulators of two disjoint sets of time steps.
+
+    Means and centred second moments are combined with the pairwise update of
+    Chan et al. (1979), sums are added, so merging partial accumulators gives
+    the same result as accumulating all time steps at once.
+    """
+    merged = {}
+    for n_name, (means, comoments) in MERGE_GROUPS.items():
+        n_a, n_b = acc_a[n_name], acc_b[n_name]
+        n = n_a + n_b
+        weight = _safe_divide(n_a * n_b, n).fillna(0)
+        delta = {m: (acc_b[m] - acc_a[m]).fillna(0) for m in means}
+        for m in means:
+            merged[m] = xr.where(
+                n_a == 0,
+                acc_b[m],
+                xr.where(
+                    n_b == 0, acc_a[m], acc_a[m] + delta[m] * _safe_divide(n_b, n)
+                ),
+            )
+        for m2, (x, y) in comoments.items():
+            merged[m2] = acc_a[m2] + acc_b[m2] + delta[x] * delta[y] * weight
+        merged[n_name] = n
+    for field in ADDITIVE_FIELDS:
+        merged[field] = acc_a[field] + acc_b[field]
+    return xr.Dataset({field: merged[field] for field in FIELDS})
+
+
+def to_sums(acc, dim):
+    """
+    Convert accumulators to power sums that can be added along ``dim``.
+
+    Sums are taken about a per-station shift, the average of the means along
+    ``dim``, which avoids the cancellation of raw power sums. Weighted
+    additions of the sums along ``dim``, e.g. resampling counts, are turned
+    back into accumulators by `from_sums`.
+
+    Returns
+    -------
+    sums : xarray.Dataset
+        Counts, first and second power sums about the shifts, and the additive
+        fields.
+    shifts : xarray.Dataset
+        The shift of each mean field, without ``dim``.
+    """
+    sums = {}
+    shifts = {}
+    for n_name, (means, comoments) in MERGE_GROUPS.items():
+        n = acc[n_name]
+        deviation = {}
+        for m in means:
+            shifts[m] = acc[m].mean(dim=dim, skipna=True).fillna(0)
+            deviation[m] = (acc[m] - shifts[m]).fillna(0)
+            sums[m] = n * deviation[m]
+        for m2, (x, y) in comoments.items():
+            sums[m2] = acc[m2] + n * deviation[x] * deviation[y]
+        sums[n_name] = n
+    for field in ADDITIVE_FIELDS:
+        sums[field] = acc[field]
+    return xr.Dataset(sums), xr.Dataset(shifts)
+
+
+def from_sums(sums, shifts):
+    """Convert power sums from `to_sums` back to accumulators."""
+    acc = {}
+    for n_name, (means, comoments) in MERGE_GROUPS.items():
+        n = sums[n_name]
+        for m in means:
+            acc[m] = (shifts[m] + _safe_divide(sums[m], n)).where(n > 0)
+        for m2, (x, y) in comoments.items():
+            correction = _safe_divide(sums[x] * sums[y], n).fillna(0)
+            acc[m2] = sums[m2] - correction
+        acc[n_name] = n
+    for field in ADDITIVE_FIELDS:
+        acc[field] = sums[field]
+    return xr.Dataset({field: acc[field] for field in FIELDS})
+
+
+def tree_reduce(accumulators):
+    """
+    Merge a sequence of accumulators pairwise in a balanced tree.
+
+    With lazy accumulators the merges of each level are independent tasks, so
+    dask reduces partial results in parallel in log2(n) levels.
+    """
+    accumulators = list(accumulators)
+    if not accumulators:
+        raise ValueError("No accumulators to reduce")
+    while len(accumulators) > 1:
+        merged = [
+            merge(accumulators[i], accumulators[i + 1])
+            for i in range(0, len(accumulators) - 1, 2)
+        ]
+        if len(accumulators) % 2:
+            merged.append(accumulators[-1])
+        accumulators = merged
+    return accumulators[0]
+
+
+def time_blocks(da, time_name, block_size=None):
+    """
+    Return the slices splitting the time dimension into blocks.
+
+    Blocks follow the dask chunks of ``da`` unless ``block_size`` is given, in
+    which case the whole dimension is a single block when it is None.
+    """
+    size = da.sizes[time_name]
+    if block_size is None:
+        if da.chunks is None:
+            return [slice(0, size)]
+        bounds = np.cumsum((0,) + da.chunksizes[time_name])
+    else:
+        bounds = np.append(np.arange(0, size, block_size), size)
+    return [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def select_block(da, time_name, block):
+    """
+    Select a time block as a single time chunk.
+
+    Blocks of ``block_size`` steps need not follow the dask chunks, so the
+    chunks a block spans are merged, time being a core dimension of the
+    kernels.
+    """
+    da = da.isel({time_name: block})
+    if da.chunks is not None and len(da.chunksizes[time_name]) > 1:
+        da = da.chunk({time_name: -1})
+    return da
+
+
+def accumulate_blocks(sim_da, obs_da, time_name, block_size=None, backend=None):
+    """
+    Accumulate time blocks independently and tree-reduce the partial results.
+
+    Only one block per task is held in memory, so archives longer than memory
+    allows are streamed when the inputs are lazily loaded or dask-backed.
+    """
+    blocks = time_blocks(sim_da, time_name, block_size)
+    logger.debug(f"Accumulating statistics over {len(blocks)} time blocks")
+    return tree_reduce(
+        accumulate(
+            select_block(sim_da, time_name, block),
+            select_block(obs_da, time_name, block),
+            time_name,
+            backend,
+        )
+        for block in blocks
+    )
+
+
+def split_positions(codes, n_groups):
+    """Return the time positions of each group code, including empty groups."""
+    order = np.argsort(codes, kind="stable")
+    bounds = np.cumsum(np.bincount(codes, minlength=n_groups))
+    return np.split(order, bounds[:-1])
+
+
+def rolling_merge(acc, dim, window):
+    """
+    Merge every run of ``window`` consecutive accumulators along ``dim``.
+
+    Runs are built by doubling, merging 1, 2, 4, ... neighbours at a time over
+    the whole dimension, so only O(log2(window)) vectorized merges are needed.
+    Element ``i`` of the result covers elements ``i`` to ``i + window - 1``.
+    """
+    length = acc.sizes[dim] - window + 1
+    if length < 1:
+        raise ValueError(
+            f"Rolling window of {window} is longer than the {acc.sizes[dim]} "
+            f"elements of '{dim}'"
+        )
+    acc = acc.drop_vars(dim, errors="ignore")
+    result = None
+    offset = 0
+    span = 1
+    remaining = window
+    while True:
+        if remaining & 1:
+            part = acc.isel({dim: slice(offset, offset + length)})
+            result = part if result is None else merge(result, part)
+            offset += span
+        remaining >>= 1
+        if not remaining:
+            return result
+        acc = merge(
+            acc.isel({dim: slice(None, -span)}), acc.isel({dim: slice(span, None)})
+        )
+        span *= 2
+
+
+def rolling_stats(sim_da, obs_da, time_name, stats, window, period="M", backend=None):
+    """
+    Compute moment-based statistics over moving windows of calendar periods.
+
+    Each period (e.g. month) is accumulated once and windows of ``window``
+    consecutive periods are merged from those partial accumulators, so the
+    data is read once whatever the window overlap. Results have a ``period``
+    dimension labelled by the start of the last period of each window.
+
+    Parameters
+    ----------
+    sim_da, obs_da : xarray.DataArray
+        Aligned simulation and observation arrays.
+    time_name : str
+        Name of the time dimension to reduce.
+    stats : list of str
+        Names of statistics, see `MOMENT_STATS`.
+    window : int
+        Number of periods per window.
+    period : str, optional
+        Pandas period alias, e.g. "D", "M", "Q" or "Y". Default is "M".
+    backend : str, optional
+        Kernel backend, "numba" or "numpy".
+
+    Returns
+    -------
+    dict of str to xarray.DataArray
+    """
+    unsupported = [stat for stat in stats if stat not in MOMENT_STATS]
+    if unsupported:
+        raise ValueError(f"Statistics {unsupported} are not supported with rolling")
+    periods = sim_da.indexes[time_name].to_period(period)
+    all_periods = pd.period_range(periods.min(), periods.max(), freq=period)
+    positions = split_positions(all_periods.get_indexer(periods), len(all_periods))
+    acc = xr.concat(
+        [
+            accumulate(
+                sim_da.isel({time_name: pos}),
+                obs_da.isel({time_name: pos}),
+                time_name,
+                backend,
+            )
+            for pos in positions
+        ],
+        dim="period",
+    )
+    acc = rolling_merge(acc, "period", window)
+    acc = acc.assign_coords(period=all_periods[window - 1 :].to_timestamp())
+    return {stat: derive(acc, stat) for stat in stats}
+
+
+def _safe_divide(a, b):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return a / b
+
+
+def _std(acc, prefix):
+    return np.sqrt(_safe_divide(acc[f"{prefix}_m2"], acc[f"{prefix}_n"]))
+
+
+def derive(acc, stat):
+    """
+    Derive a moment-based statistic from accumulated sufficient statistics.
+
+    Matches the definitions in `hyve.hydrostats.stats`, with standard
+    deviations using ``ddof=0`` as in `xarray.DataArray.std`.
+    """
+    if stat == "bias":
+        return acc.pair_sim_mean - acc.pair_obs_mean
+    if stat == "mae":
+        return _safe_divide(acc.pair_sae, acc.pair_n)
+    if stat == "mape":
+        return _safe_divide(derive(acc, "mae"), acc.obs_abs_sum)
+    if stat == "mse":
+        return _safe_divide(acc.pair_sse, acc.pair_n)
+    if stat == "rmse":
+        return np.sqrt(derive(acc, "mse"))
+    if stat == "br":
+        return _safe_divide(acc.sim_mean, acc.obs_mean)
+    if stat == "vr":
+        return _safe_divide(
+            _std(acc, "sim") * acc.obs_mean, _std(acc, "obs") * acc.sim_mean
+        )
+    if stat == "pc_bias":
+        return _safe_divide(derive(acc, "bias"), acc.obs_mean)
+    if stat == "correlation":
+        r = _safe_divide(acc.pair_cov, np.sqrt(acc.pair_sim_m2 * acc.pair_obs_m2))
+        return r.where(acc.pair_n >= 2)
+    if stat == "kge":
+        r = derive(acc, "correlation")
+        B = derive(acc, "br")
+        y = derive(acc, "vr")
+        return 1 - np.sqrt((r - 1) ** 2 + (B - 1) ** 2 + (y - 1) ** 2)
+    if stat == "nse":
+        return 1 - _safe_divide(acc.pair_sse, acc.obs_m2)
+    raise ValueError(f"Statistic '{stat}' cannot be derived from moments.")
+
+
+def index_agreement(acc, sim_da, obs_da, time_name, block_size=None, backend=None):
+    """Index of agreement from accumulated moments and a second data pass."""
+    _, index_agreement_kernel = get_backend(backend)
+    denominator = sum(
+        xr.apply_ufunc(
+            index_agreement_kernel,
+            select_block(sim_da, time_name, block),
+            select_block(obs_da, time_name, block),
+            acc.obs_mean,
+            input_core_dims=[[time_name], [time_name], []],
+            dask="parallelized",
+            output_dtypes=[float],
+        )
+        for block in time_blocks(sim_da, time_name, block_size)
+    )
+    return 1 - _safe_divide(acc.pair_sse, denominator)
+
+
+def fused_stats(sim_da, obs_da, time_name, stats, block_size=None, backend=None):
+    """
+    Compute several statistics from a single accumulation pass.
+
+    Time blocks are accumulated independently and merged, see
+    `accumulate_blocks`.
+
+    Parameters
+    ----------
+    sim_da, obs_da : xarray.DataArray
+        Aligned simulation and observation arrays.
+    time_name : str
+        Name of the time dimension to reduce.
+    stats : list of str
+        Names of statistics, see `FUSED_STATS`.
+    block_size : int, optional
+        Number of time steps per block, defaulting to the dask chunks.
+    backend : str, optional
+        Kernel backend, "numba" or "numpy", defaulting to numba if installed.
+
+    Returns
+    -------
+    dict of str to xarray.DataArray
+    """
+    unsupported = [stat for stat in stats if stat not in FUSED_STATS]
+    if unsupported:
+        raise ValueError(
+            f"Statistics {unsupported} are not supported by the fused engine"
+        )
+    acc = accumulate_blocks(sim_da, obs_da, time_name, block_size, backend)
+    result = {}
+    for stat in stats:
+        if stat in SECOND_PASS_STATS:
+            result[stat] = index_agreement(
+                acc, sim_da, obs_da, time_name, block_size, backend
+            )
+        else:
+            result[stat] = derive(acc, stat)
+    return result
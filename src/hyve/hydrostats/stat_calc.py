@@ -1,28 +1,139 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+import pandas as pd
 import xarray as xr
 
 from hyve.core import load_da
-from hyve.hydrostats import stats
+from hyve.hydrostats import probabilistic, stats
+from hyve.hydrostats.bootstrap import bootstrap_stats
+from hyve.hydrostats.moments import (
+    FUSED_STATS,
+    MOMENT_STATS,
+    fused_stats,
+    rolling_stats,
+    split_positions,
+)
+from hyve.hydrostats.probabilistic import PROBABILISTIC_STATS
+
+
+def _is_sorted(values):
+    return values.size < 2 or bool(np.all(values[1:] > values[:-1]))
+
+
+def match_positions(a, b):
+    """
+    Return the positions in ``a`` and ``b`` of their common values.
+
+    Positions follow the sorted order of the common values, as `np.intersect1d`.
+    When both are the same strictly increasing array, the positions are None,
+    meaning that no gather is needed.
+    """
+    if a.shape == b.shape and np.array_equal(a, b) and _is_sorted(a):
+        return None, None
+    _, a_pos, b_pos = np.intersect1d(a, b, return_indices=True)
+    return a_pos, b_pos
+
+
+def match_times_nearest(sim_times, obs_times, tolerance):
+    """
+    Match each sim time to the nearest obs time within a tolerance.
+
+    Unmatched sim times are dropped and each obs time is used at most once,
+    by the closest sim time, the earliest one on ties. Pairs are returned in
+    the order of the sim times.
+    """
+    tolerance = pd.Timedelta(tolerance)
+    obs_index = pd.DatetimeIndex(obs_times)
+    order = np.argsort(obs_index.values, kind="stable")
+    sorted_index = obs_index[order]
+    nearest = sorted_index.get_indexer(
+        pd.DatetimeIndex(sim_times), method="nearest", tolerance=tolerance
+    )
+    sim_pos = np.flatnonzero(nearest >= 0)
+    obs_pos = order[nearest[sim_pos]]
+    distance = np.abs(
+        pd.DatetimeIndex(sim_times)[sim_pos].values - obs_index[obs_pos].values
+    )
+    # the closest sim time of each obs time comes first, then the earliest
+    ranked = np.lexsort((sim_pos, distance, obs_pos))
+    _, first = np.unique(obs_pos[ranked], return_index=True)
+    best = np.sort(ranked[first])
+    return sim_pos[best], obs_pos[best]
 
 
-def find_valid_subset(sim_da, obs_da, sim_coords, obs_coords, new_coords):
+def _take(da, dim, positions):
+    return da if positions is None else da.isel({dim: positions})
+
+
+def alignment_positions(sim_da, obs_da, sim_coords, obs_coords, time_tolerance=None):
+    """
+    Compute the positional indexers aligning sim and obs.
+
+    Returns
+    -------
+    dict
+        Positions of the common stations and times in sim and obs, keyed by
+        "sim_station", "sim_time", "obs_station" and "obs_time". None means
+        that the dimension is used as is.
+    """
+    sim_station_pos, obs_station_pos = match_positions(
+        sim_da[sim_coords.get("s", "station")].values,
+        obs_da[obs_coords.get("s", "station")].values,
+    )
+    sim_times = sim_da[sim_coords.get("t", "time")].values
+    obs_times = obs_da[obs_coords.get("t", "time")].values
+    if time_tolerance is None:
+        sim_time_pos, obs_time_pos = match_positions(sim_times, obs_times)
+    else:
+        sim_time_pos, obs_time_pos = match_times_nearest(
+            sim_times, obs_times, time_tolerance
+        )
+    return {
+        "sim_station": sim_station_pos,
+        "sim_time": sim_time_pos,
+        "obs_station": obs_station_pos,
+        "obs_time": obs_time_pos,
+    }
+
+
+def find_valid_subset(
+    sim_da,
+    obs_da,
+    sim_coords,
+    obs_coords,
+    new_coords,
+    time_tolerance=None,
+    positions=None,
+):
+    """
+    Align sim and obs on their common stations and times.
+
+    Positional indexers are computed once per dimension, or reused from
+    ``positions`` (see `alignment_positions`), and the gather is skipped for
+    dimensions that are already aligned. With ``time_tolerance`` (e.g. "6h"),
+    each sim time is matched to the nearest obs time within the tolerance,
+    each obs time is kept for its closest sim time only, and obs take the sim
+    time labels.
+    """
+    if positions is None:
+        positions = alignment_positions(
+            sim_da, obs_da, sim_coords, obs_coords, time_tolerance
+        )
     sim_station_colname = sim_coords.get("s", "station")
     obs_station_colname = obs_coords.get("s", "station")
-    matching_stations = np.intersect1d(
-        sim_da[sim_station_colname].values, obs_da[obs_station_colname].values
-    )
     sim_time_colname = sim_coords.get("t", "time")
     obs_time_colname = obs_coords.get("t", "time")
-    matching_times = np.intersect1d(
-        sim_da[sim_time_colname].values, obs_da[obs_time_colname].values
-    )
 
-    sim_da = sim_da.sel(
-        {sim_time_colname: matching_times, sim_station_colname: matching_stations}
-    )
-    obs_da = obs_da.sel(
-        {obs_time_colname: matching_times, obs_station_colname: matching_stations}
-    )
+    sim_da = _take(sim_da, sim_station_colname, positions["sim_station"])
+    sim_da = _take(sim_da, sim_time_colname, positions["sim_time"])
+    obs_da = _take(obs_da, obs_station_colname, positions["obs_station"])
+    obs_da = _take(obs_da, obs_time_colname, positions["obs_time"])
+    if time_tolerance is not None:
+        obs_da = obs_da.assign_coords(
+            {obs_time_colname: sim_da[sim_time_colname].values}
+        )
 
     sim_da = sim_da.rename(
         {
@@ -40,20 +151,257 @@ def find_valid_subset(sim_da, obs_da, sim_coords, obs_coords, new_coords):
     return sim_da, obs_da
 
 
+def compute_stats(
+    sim_da,
+    obs_da,
+    time_name,
+    stat_names,
+    engine="fused",
+    block_size=None,
+    backend=None,
+    member_dim="ensemble",
+    reference_da=None,
+):
+    """
+    Compute the requested statistics of aligned sim and obs arrays.
+
+    The "fused" engine derives every supported statistic from one accumulation
+    pass over the data, the "xarray" engine calls each function of
+    `hyve.hydrostats.stats` in turn. Statistics the fused engine does not
+    support are computed by their own function. ``block_size`` sets the
+    number of time steps accumulated at once by the fused engine and
+    ``backend`` its kernels, compiled with "numba" or plain "numpy".
+
+    Probabilistic statistics score the ensemble along ``member_dim``, and
+    "crpss" is relative to the forecasts in ``reference_da``.
+    """
+    if engine not in ("fused", "xarray"):
+        raise ValueError(f"Unknown statistics engine '{engine}'")
+    stat_dict = {}
+    if engine == "fused":
+        fused = [stat for stat in stat_names if stat in FUSED_STATS]
+        stat_dict.update(
+            fused_stats(sim_da, obs_da, time_name, fused, block_size, backend)
+        )
+    for stat in stat_names:
+        if stat in stat_dict:
+            continue
+        if stat == "crpss":
+            if reference_da is None:
+                raise ValueError("CRPSS requires a reference forecast")
+            stat_dict[stat] = probabilistic.crpss(
+                sim_da, obs_da, time_name, reference_da, member_dim
+            )
+        elif stat in PROBABILISTIC_STATS:
+            stat_dict[stat] = getattr(probabilistic, stat)(
+                sim_da, obs_da, time_name, member_dim
+            )
+        else:
+            stat_dict[stat] = getattr(stats, stat)(sim_da, obs_da, time_name)
+    return {stat: stat_dict[stat] for stat in stat_names}
+
+
+def time_groups(da, time_name, groupby):
+    """
+    Split the time dimension into the groups of a coordinate.
+
+    ``groupby`` is a coordinate along time, e.g. a lead time, or a datetime
+    component such as "time.month" or "time.season".
+
+    Returns
+    -------
+    name : str
+        Name of the group dimension.
+    labels : numpy.ndarray
+        Sorted unique group labels.
+    positions : list of numpy.ndarray
+        Time positions of each group.
+    """
+    try:
+        coord = da[groupby]
+    except KeyError:
+        raise ValueError(f"Cannot group by '{groupby}': no such coordinate") from None
+    if coord.dims != (time_name,):
+        raise ValueError(
+            f"Cannot group by '{groupby}': it must be a 1-D coordinate along "
+            f"'{time_name}'"
+        )
+    labels, codes = np.unique(coord.values, return_inverse=True)
+    return coord.name, labels, split_positions(codes, len(labels))
+
+
+def grouped_stats(sim_da, obs_da, time_name, stat_names, groupby, **kwargs):
+    """
+    Compute statistics per group of time steps, see `time_groups`.
+
+    Every time step belongs to one group, so the data is accumulated once
+    across all groups. Results gain a dimension named after the grouping.
+    """
+    name, labels, positions = time_groups(sim_da, time_name, groupby)
+    results = [
+        compute_stats(
+            sim_da.isel({time_name: pos}),
+            obs_da.isel({time_name: pos}),
+            time_name,
+            stat_names,
+            **kwargs,
+        )
+        for pos in positions
+    ]
+    group_index = pd.Index(labels, name=name)
+    return {
+        stat: xr.concat([result[stat] for result in results], dim=group_index)
+        for stat in stat_names
+    }
+
+
+def _score(sim_da, obs_da, time_name, config, reference_da=None):
+    engine = config.get("engine", "fused")
+    backend = config.get("backend")
+    probabilistic_kwargs = {"member_dim": config.get("member_dim", "ensemble")}
+    if reference_da is not None:
+        probabilistic_kwargs["reference_da"] = reference_da
+    if "groupby" in config and "rolling" in config:
+        raise ValueError("Only one of 'groupby' and 'rolling' can be set")
+    if "bootstrap" in config and ("groupby" in config or "rolling" in config):
+        raise ValueError(
+            "Bootstrap confidence intervals are not computed per group, "
+            "'bootstrap' cannot be combined with 'groupby' or 'rolling'"
+        )
+    if "rolling" in config:
+        if engine != "fused":
+            raise ValueError("Rolling statistics require the fused engine")
+        stat_dict = rolling_stats(
+            sim_da,
+            obs_da,
+            time_name,
+            config["stats"],
+            config["rolling"]["window"],
+            config["rolling"].get("period", "M"),
+            backend,
+        )
+    elif "groupby" in config:
+        stat_dict = grouped_stats(
+            sim_da,
+            obs_da,
+            time_name,
+            config["stats"],
+            config["groupby"],
+            engine=engine,
+            block_size=config.get("time_block"),
+            backend=backend,
+            **probabilistic_kwargs,
+        )
+    else:
+        stat_dict = compute_stats(
+            sim_da,
+            obs_da,
+            time_name,
+            config["stats"],
+            engine=engine,
+            block_size=config.get("time_block"),
+            backend=backend,
+            **probabilistic_kwargs,
+        )
+    if "bootstrap" in config:
+        # intervals of the moment statistics requested, unless a subset is given
+        bootstrap_config = dict(config["bootstrap"])
+        ci_stats = bootstrap_config.pop(
+            "stats", [stat for stat in config["stats"] if stat in MOMENT_STATS]
+        )
+        if ci_stats:
+            stat_dict.update(
+                bootstrap_stats(sim_da, obs_da, time_name, ci_stats, **bootstrap_config)
+            )
+    return xr.Dataset(stat_dict)
+
+
+def _cached_positions(cache, sim_da, sim_coords, compute):
+    # experiments on the same stations and times share their alignment
+    station = sim_da[sim_coords.get("s", "station")].values
+    times = sim_da[sim_coords.get("t", "time")].values
+    for cached_station, cached_times, positions in cache:
+        if np.array_equal(station, cached_station) and np.array_equal(
+            times, cached_times
+        ):
+            return positions
+    positions = compute()
+    cache.append((station, times, positions))
+    return positions
+
+
 def stat_calc(config):
-    sim_config = config["sim"]
-    sim_da, _ = load_da(sim_config, 2)
+    """
+    Compute statistics of simulations against observations.
+
+    ``config["sim"]`` is a single source, or a list of sources in multi-sim
+    mode. In that mode the observations are loaded once, experiments sharing
+    stations and times reuse the same alignment indexers, and experiments are
+    scored concurrently by ``config["workers"]`` threads. The result then has
+    an ``experiment`` dimension labelled by each source's ``name``.
+    """
     obs_config = config["obs"]
     obs_da, _ = load_da(obs_config, 2)
     new_coords = config["output"]["coords"]
-    sim_da, obs_da = find_valid_subset(
-        sim_da, obs_da, sim_config["coords"], obs_config["coords"], new_coords
-    )
-    stat_dict = {}
-    for stat in config["stats"]:
-        func = getattr(stats, stat)
-        stat_dict[stat] = func(sim_da, obs_da, new_coords.get("t", "time"))
-    ds = xr.Dataset(stat_dict)
+    time_name = new_coords.get("t", "time")
+    time_tolerance = config.get("time_tolerance")
+    reference_da = None
+    if "reference" in config:
+        ref_config = config["reference"]
+        reference_da, _ = load_da(ref_config, 2)
+        reference_da, _ = find_valid_subset(
+            reference_da,
+            obs_da,
+            ref_config["coords"],
+            obs_config["coords"],
+            new_coords,
+            time_tolerance,
+        )
+
+    multi_sim = isinstance(config["sim"], list)
+    sim_configs = config["sim"] if multi_sim else [config["sim"]]
+    position_cache = []
+    position_lock = threading.Lock()
+    if multi_sim:
+        # read the observations once for all experiments
+        obs_da = obs_da.load()
+
+    def score(sim_config):
+        sim_da, _ = load_da(sim_config, 2)
+        with position_lock:
+            positions = _cached_positions(
+                position_cache,
+                sim_da,
+                sim_config["coords"],
+                lambda: alignment_positions(
+                    sim_da,
+                    obs_da,
+                    sim_config["coords"],
+                    obs_config["coords"],
+                    time_tolerance,
+                ),
+            )
+        sim_da, sim_obs_da = find_valid_subset(
+            sim_da,
+            obs_da,
+            sim_config["coords"],
+            obs_config["coords"],
+            new_coords,
+            time_tolerance,
+            positions,
+        )
+        return _score(sim_da, sim_obs_da, time_name, config, reference_da)
+
+    if multi_sim:
+        names = [
+            sim_config.get("name", f"sim{i}")
+            for i, sim_config in enumerate(sim_configs)
+        ]
+        with ThreadPoolExecutor(max_workers=config.get("workers")) as executor:
+            results = list(executor.map(score, sim_configs))
+        ds = xr.concat(results, dim=pd.Index(names, name="experiment"), join="outer")
+    else:
+        ds = score(sim_configs[0])
     if config["output"].get("file", None) is not None:
         ds.to_netcdf(config["output"]["file"])
     return ds
@@ -1,5 +1,6 @@
 import numpy as np
 import xarray as xr
+from scipy.stats import rankdata
 
 
 def bias(sim_da, obs_da, time_name):
@@ -48,22 +49,44 @@ def pc_bias(sim_da, obs_da, time_name):
     )
 
 
-def correlation(sim_da, obs_da, time_name):
-    def _corr(a, b):
-        mask = ~np.isnan(a) & ~np.isnan(b)
-        if np.sum(mask) < 2:
-            return np.nan
-        return np.corrcoef(a[mask], b[mask])[0, 1]
-
-    return xr.apply_ufunc(
-        _corr,
-        sim_da,
-        obs_da,
-        input_core_dims=[[time_name], [time_name]],
-        vectorize=True,
-        dask="parallelized",
-        output_dtypes=[float],
+def _rank(x):
+    return rankdata(x, axis=-1, nan_policy="omit")
+
+
+def correlation(sim_da, obs_da, time_name, method="pearson"):
+    # NaN-masked over the time steps where both series are valid, with fewer
+    # than two valid pairs giving NaN. Only array reductions are used, so dask
+    # arrays are processed blockwise.
+    mask = sim_da.notnull() & obs_da.notnull()
+    sim_da = sim_da.where(mask)
+    obs_da = obs_da.where(mask)
+    if method == "spearman":
+        # ranks need the whole series, so time is a single chunk
+        sim_da, obs_da = (
+            xr.apply_ufunc(
+                _rank,
+                da if da.chunks is None else da.chunk({time_name: -1}),
+                input_core_dims=[[time_name]],
+                output_core_dims=[[time_name]],
+                dask="parallelized",
+                output_dtypes=[float],
+            )
+            for da in (sim_da, obs_da)
+        )
+    elif method != "pearson":
+        raise ValueError(f"Unknown correlation method '{method}'")
+    sim_anom = sim_da - sim_da.mean(dim=time_name, skipna=True)
+    obs_anom = obs_da - obs_da.mean(dim=time_name, skipna=True)
+    covariance = (sim_anom * obs_anom).sum(dim=time_name, skipna=True)
+    variance = (sim_anom**2).sum(dim=time_name, skipna=True) * (obs_anom**2).sum(
+        dim=time_name, skipna=True
     )
+    r = covariance / np.sqrt(variance)
+    return r.where(mask.sum(dim=time_name) >= 2)
+
+
+def spearman(sim_da, obs_da, time_name):
+    return correlation(sim_da, obs_da, time_name, method="spearman")
 
 
 def kge(sim_da, obs_da, time_name):
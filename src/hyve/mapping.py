@@ -0,0 +1,117 @@
+import logging
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def to_unit_vectors(lat, lon):
+    """
+    Convert latitude/longitude in degrees to 3D unit vectors.
+
+    Euclidean (chord) distance between unit vectors is monotonic with the
+    great-circle distance, so nearest neighbours found in this space are the
+    great-circle nearest neighbours.
+
+    Parameters
+    ----------
+    lat : array_like
+        Latitudes in degrees.
+    lon : array_like
+        Longitudes in degrees.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (n, 3) with the flattened input points.
+    """
+    lat = np.deg2rad(np.asarray(lat, dtype=float).ravel())
+    lon = np.deg2rad(np.asarray(lon, dtype=float).ravel())
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(chord):
+    """Convert chord length on the unit sphere to great-circle distance in km."""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+
+def nearest_axis_index(values, axis):
+    """
+    Find the index of the nearest axis value for each value.
+
+    Equivalent to ``np.argmin(np.abs(values[:, None] - axis), axis=1)`` on the
+    ascending axis, but runs in O((n + m) log m) without the dense distance
+    matrix. The axis does not need to be sorted: indices refer to its native
+    order and ties go to the lower axis value.
+
+    Parameters
+    ----------
+    values : array_like
+        Values to look up, shape (n,).
+    axis : array_like
+        Axis values, shape (m,).
+
+    Returns
+    -------
+    numpy.ndarray
+        Integer indices into ``axis``, shape (n,).
+    """
+    values = np.asarray(values)
+    axis = np.asarray(axis)
+    order = np.argsort(axis, kind="stable")
+    sorted_axis = axis[order]
+
+    right = np.clip(np.searchsorted(sorted_axis, values), 0, axis.size - 1)
+    left = np.clip(right - 1, 0, axis.size - 1)
+    dist_left = np.abs(values - sorted_axis[left])
+    dist_right = np.abs(values - sorted_axis[right])
+
+    use_left = dist_left <= dist_right
+    return np.where(use_left, order[left], order[right])
+
+
+def build_tree(grid_lat, grid_lon):
+    """Build a KD-tree over grid points of any shape on the unit sphere."""
+    logger.debug(f"Building KD-tree over {np.size(grid_lat)} grid points")
+    return cKDTree(to_unit_vectors(grid_lat, grid_lon))
+
+
+def nearest_grid_points(lat, lon, grid_lat, grid_lon, k=1, tree=None):
+    """
+    Find the k nearest grid points to each station by great-circle distance.
+
+    Works on regular, curvilinear and unstructured (e.g. reduced Gaussian)
+    grids, as grid points are treated as a point cloud.
+
+    Parameters
+    ----------
+    lat, lon : array_like
+        Station latitudes and longitudes in degrees, shape (n,).
+    grid_lat, grid_lon : array_like
+        Grid point latitudes and longitudes in degrees. Any shape, as long as
+        both have the same shape.
+    k : int, optional
+        Number of candidates to return per station. Default is 1.
+    tree : scipy.spatial.cKDTree, optional
+        Pre-built tree from `build_tree`, reused across calls.
+
+    Returns
+    -------
+    distances : numpy.ndarray
+        Great-circle distances in km, shape (n,) if k == 1 else (n, k).
+    indices : numpy.ndarray
+        Flat indices into the grid arrays, same shape as ``distances``.
+    """
+    if np.shape(grid_lat) != np.shape(grid_lon):
+        raise ValueError(
+            f"Grid latitude and longitude shapes differ: "
+            f"{np.shape(grid_lat)} != {np.shape(grid_lon)}"
+        )
+    if tree is None:
+        tree = build_tree(grid_lat, grid_lon)
+    chord, indices = tree.query(to_unit_vectors(lat, lon), k=k)
+    return chord_to_km(chord), indices
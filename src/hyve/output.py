@@ -0,0 +1,212 @@
+import logging
+import os
+import time
+from typing import Any
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hyve.core import peak_rss_mb, progress_bar
+
+logger = logging.getLogger(__name__)
+
+FORMAT_SUFFIXES = {".zarr": "zarr", ".parquet": "parquet", ".pq": "parquet"}
+
+
+def output_format(output_config: dict[str, Any]) -> str:
+    """Return the configured output format, inferred from the file suffix."""
+    suffix = os.path.splitext(output_config["file"].rstrip("/"))[1]
+    return output_config.get("format", FORMAT_SUFFIXES.get(suffix, "netcdf"))
+
+
+def output_time_dim(output_config: dict[str, Any]) -> str:
+    return output_config.get("time_dim", "time")
+
+
+def path_size(path) -> int:
+    """Return the size in bytes of a file, or of all files below a directory."""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def _storage_chunks(var, output_config):
+    chunks = output_config.get("storage_chunks", {})
+    return tuple(min(chunks.get(dim, size), size) for dim, size in var.sizes.items())
+
+
+def _netcdf_encoding(ds, output_config):
+    compression = output_config.get("compression")
+    encoding = {}
+    for name, var in ds.data_vars.items():
+        var_encoding = {}
+        if compression is not None:
+            var_encoding.update(
+                zlib=True,
+                complevel=compression.get("complevel", 4),
+                shuffle=compression.get("shuffle", True),
+            )
+        if "storage_chunks" in output_config:
+            var_encoding["chunksizes"] = _storage_chunks(var, output_config)
+        if var_encoding:
+            encoding[name] = var_encoding
+    return encoding
+
+
+def _write_netcdf(ds, path, output_config, compute):
+    # appendable NetCDF files need an unlimited time dimension
+    unlimited_dims = None
+    if output_config.get("append"):
+        unlimited_dims = [output_time_dim(output_config)]
+    return ds.to_netcdf(
+        path,
+        engine="netcdf4",
+        encoding=_netcdf_encoding(ds, output_config),
+        unlimited_dims=unlimited_dims,
+        compute=compute,
+    )
+
+
+def _write_zarr(ds, path, output_config, compute):
+    encoding = {}
+    if "storage_chunks" in output_config:
+        # dask chunks must align with zarr chunks for parallel writes
+        if ds.chunks:
+            ds = ds.chunk(output_config["storage_chunks"])
+        encoding = {
+            name: {"chunks": _storage_chunks(var, output_config)}
+            for name, var in ds.data_vars.items()
+        }
+    return ds.to_zarr(path, mode="w", encoding=encoding, compute=compute)
+
+
+def _write_parquet(ds, path, output_config, compute):
+    # long format, with the dimensions as columns for per-station reads
+    compression = (output_config.get("compression") or {}).get("codec", "zstd")
+    if not ds.chunks:
+        ds.to_dataframe().reset_index().to_parquet(
+            path, compression=compression, index=False
+        )
+        return None
+    if "storage_chunks" in output_config:
+        ds = ds.chunk(output_config["storage_chunks"])
+    # one parquet file is written per dask partition, in parallel
+    return ds.to_dask_dataframe().to_parquet(
+        path, compression=compression, write_index=False, compute=compute
+    )
+
+
+WRITERS = {"netcdf": _write_netcdf, "zarr": _write_zarr, "parquet": _write_parquet}
+
+
+def write_output(
+    ds: xr.Dataset, output_config: dict[str, Any], progress: bool = True
+) -> None:
+    """
+    Write the extracted dataset to NetCDF, Zarr or Parquet.
+
+    Lazy datasets are stored block by block as each dask chunk is computed, so
+    only the chunks in flight are held in memory and chunks are written in
+    parallel where the backend allows it. ``storage_chunks`` sets the on-disk
+    chunking per dimension (e.g. station and time) and ``compression`` the
+    NetCDF zlib level or the Parquet codec. Write time and size are logged.
+    """
+    path = output_config["file"]
+    fmt = output_format(output_config)
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported output format '{fmt}'")
+    lazy = bool(ds.chunks)
+    logger.info(f"Saving output to {path} ({fmt})")
+    start_time = time.perf_counter()
+    task = WRITERS[fmt](ds, path, output_config, compute=not lazy)
+    if lazy and task is not None:
+        with progress_bar(progress):
+            task.compute()
+    elapsed = time.perf_counter() - start_time
+    logger.info(
+        f"Wrote {path_size(path) / 2**20:.2f} MiB to {path} in {elapsed:.2f}s, "
+        f"peak resident memory: {peak_rss_mb():.1f} MiB"
+    )
+
+
+def last_output_time(output_config: dict[str, Any]) -> np.datetime64 | None:
+    """Return the last timestamp of an existing output, None if there is none."""
+    path = output_config["file"]
+    if not os.path.exists(path):
+        return None
+    time_dim = output_time_dim(output_config)
+    fmt = output_format(output_config)
+    if fmt == "zarr":
+        ds = xr.open_zarr(path)
+    elif fmt == "netcdf":
+        ds = xr.open_dataset(path)
+    else:
+        raise ValueError(f"Append is not supported for '{fmt}' output")
+    with ds:
+        if ds.sizes.get(time_dim, 0) == 0:
+            return None
+        return ds[time_dim].values.max()
+
+
+def append_output(ds: xr.Dataset, output_config: dict[str, Any]) -> None:
+    """
+    Append new time steps to an existing NetCDF or Zarr output.
+
+    Zarr stores are appended along the time dimension. NetCDF files are
+    written in place along their unlimited time dimension, so that only the
+    new steps are written.
+    """
+    path = output_config["file"]
+    time_dim = output_time_dim(output_config)
+    fmt = output_format(output_config)
+    logger.info(f"Appending {ds.sizes[time_dim]} steps of {time_dim} to {path}")
+    if fmt == "zarr":
+        with xr.open_zarr(path) as existing:
+            _check_append_stations(existing, ds)
+        ds.to_zarr(path, append_dim=time_dim)
+    elif fmt == "netcdf":
+        with xr.open_dataset(path) as existing:
+            _check_append_stations(existing, ds)
+        _append_netcdf(ds, path, time_dim)
+    else:
+        raise ValueError(f"Append is not supported for '{fmt}' output")
+
+
+def _check_append_stations(existing: xr.Dataset, ds: xr.Dataset) -> None:
+    if not np.array_equal(existing["station"].values, ds["station"].values):
+        raise ValueError(
+            "Stations of the new data differ from the existing output; "
+            "append requires the same station list."
+        )
+
+
+def _append_netcdf(ds: xr.Dataset, path: str, time_dim: str) -> None:
+    with netCDF4.Dataset(path, "a") as nc:
+        if not nc.dimensions[time_dim].isunlimited():
+            raise ValueError(
+                f"Dimension '{time_dim}' of {path} is not unlimited; "
+                "recreate the output with append enabled to extend it."
+            )
+        start = len(nc.dimensions[time_dim])
+        stop = start + ds.sizes[time_dim]
+        for name, var in nc.variables.items():
+            if time_dim not in var.dimensions or name not in ds.variables:
+                continue
+            region = tuple(
+                slice(start, stop) if dim == time_dim else slice(None)
+                for dim in var.dimensions
+            )
+            if name == time_dim:
+                times = pd.to_datetime(ds[time_dim].values).to_pydatetime()
+                values = netCDF4.date2num(
+                    times, var.units, getattr(var, "calendar", "standard")
+                )
+            else:
+                values = ds[name].transpose(*var.dimensions).values
+            var[region] = values
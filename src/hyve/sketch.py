@@ -0,0 +1,147 @@
+import numpy as np
+
+# Mergeable quantile sketches in the style of the merging t-digest (Dunning &
+# Ertl, 2019): each sketch is a fixed number of centroids (mean, weight)
+# sorted by mean, plus the exact minimum and maximum. All functions work on
+# the last axis, so the sketches of many points and days are built and merged
+# in a few vectorized calls instead of one object per sketch.
+
+
+def _centroid_scale(q, n_centroids):
+    # k1 scale function, centroids get smaller towards the tails
+    return n_centroids * (np.arcsin(2 * q - 1) / np.pi + 0.5)
+
+
+def compress(values, weights, compression=100):
+    """
+    Merge weighted values into centroids along the last axis.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Values sorted along the last axis, with NaNs last.
+    weights : numpy.ndarray
+        Weights of the values, zero for NaNs.
+    compression : int, optional
+        Compression parameter, the sketch keeps ``compression // 2`` centroids.
+        The rank error is of order 1 / compression around the median and
+        smaller in the tails. Default is 100.
+
+    Returns
+    -------
+    mean, weight : numpy.ndarray
+        Centroids sorted by mean, with empty centroids (NaN mean and zero
+        weight) last, shape ``values.shape[:-1] + (compression // 2,)``.
+    """
+    n_centroids = max(compression // 2, 1)
+    total = weights.sum(axis=-1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        q = np.where(total > 0, (np.cumsum(weights, axis=-1) - weights / 2) / total, 0)
+    bucket = np.minimum(
+        _centroid_scale(q, n_centroids).astype(int), n_centroids - 1
+    ).reshape(-1, values.shape[-1])
+    # one bincount sums the centroids of every sketch at once
+    lead = values.shape[:-1]
+    n_sketches = bucket.shape[0]
+    index = (np.arange(n_sketches)[:, None] * n_centroids + bucket).ravel()
+    size = n_sketches * n_centroids
+    weight = np.bincount(index, weights.ravel(), size)
+    total_value = np.bincount(
+        index, (np.where(weights > 0, values, 0.0) * weights).ravel(), size
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(weight > 0, total_value / weight, np.nan)
+    mean = mean.reshape(lead + (n_centroids,))
+    weight = weight.reshape(lead + (n_centroids,))
+    order = np.argsort(mean, axis=-1, kind="stable")
+    return np.take_along_axis(mean, order, -1), np.take_along_axis(weight, order, -1)
+
+
+def build(samples, compression=100):
+    """
+    Sketch samples along the last axis.
+
+    Returns
+    -------
+    mean, weight : numpy.ndarray
+        Centroids, see `compress`.
+    vmin, vmax : numpy.ndarray
+        Minimum and maximum of the valid samples.
+    n_missing : numpy.ndarray
+        Number of NaN samples.
+    """
+    samples = np.sort(samples, axis=-1)
+    valid = ~np.isnan(samples)
+    mean, weight = compress(samples, valid.astype(float), compression)
+    n_valid = valid.sum(axis=-1)
+    last = np.take_along_axis(samples, np.maximum(n_valid - 1, 0)[..., None], -1)
+    vmin = np.where(n_valid > 0, samples[..., 0], np.nan)
+    vmax = np.where(n_valid > 0, last[..., 0], np.nan)
+    return mean, weight, vmin, vmax, samples.shape[-1] - n_valid
+
+
+def merge(mean, weight, compression=100):
+    """Merge the centroids of several sketches, concatenated on the last axis."""
+    order = np.argsort(mean, axis=-1, kind="stable")
+    return compress(
+        np.take_along_axis(mean, order, -1),
+        np.take_along_axis(weight, order, -1),
+        compression,
+    )
+
+
+def update(first, second, compression=100):
+    """Merge two sketches, tuples of `build`, into one."""
+    mean, weight = merge(
+        np.concatenate((first[0], second[0]), axis=-1),
+        np.concatenate((first[1], second[1]), axis=-1),
+        compression,
+    )
+    return (
+        mean,
+        weight,
+        np.fmin(first[2], second[2]),
+        np.fmax(first[3], second[3]),
+        first[4] + second[4],
+    )
+
+
+def quantiles(mean, weight, vmin, vmax, percentiles):
+    """
+    Percentiles of sketches, with percentiles as the last axis.
+
+    Centroids are placed at the rank of their centre of mass and interpolated
+    linearly, with the exact minimum and maximum at the ends, which matches
+    the linear method of `numpy.percentile` when each centroid holds a single
+    sample.
+    """
+    percentiles = np.asarray(percentiles, dtype=float)
+    total = weight.sum(axis=-1, keepdims=True)
+    empty = weight == 0
+    # empty centroids are last and collapse onto the maximum
+    ranks = np.concatenate(
+        [
+            np.full_like(total, 0.5),
+            np.where(empty, total - 0.5, np.cumsum(weight, axis=-1) - weight / 2),
+            total - 0.5,
+        ],
+        axis=-1,
+    )
+    values = np.concatenate(
+        [vmin[..., None], np.where(empty, vmax[..., None], mean), vmax[..., None]],
+        axis=-1,
+    )
+    target = percentiles / 100 * (total - 1) + 0.5
+    lower = (ranks[..., None, :] <= target[..., :, None]).sum(axis=-1) - 1
+    lower = np.clip(lower, 0, ranks.shape[-1] - 2)
+    rank0 = np.take_along_axis(ranks, lower, -1)
+    rank1 = np.take_along_axis(ranks, lower + 1, -1)
+    value0 = np.take_along_axis(values, lower, -1)
+    value1 = np.take_along_axis(values, lower + 1, -1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.where(rank1 > rank0, (target - rank0) / (rank1 - rank0), 0.0)
+    result = value0 + np.clip(fraction, 0, 1) * (value1 - value0)
+    # merged centroids may hold the extremes, which are known exactly
+    result = np.where(percentiles == 0, vmin[..., None], result)
+    result = np.where(percentiles == 100, vmax[..., None], result)
+    return np.where(total > 0, result, np.nan)
@@ -0,0 +1,212 @@
+"""Unit tests for the climatology engine."""
+
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from hyve import climatology as climatology_module
+from hyve import sketch
+from hyve.climatology import (
+    climatology,
+    climatology_sketch,
+    compute_climatology,
+    default_chunk_size,
+    merge_sketches,
+    window_steps,
+)
+
+TOOL = Path(__file__).parents[1] / "tools" / "clim-benchmark.py"
+PERCENTILES = np.arange(0, 101, 10)
+
+
+@pytest.fixture
+def discharge():
+    # two years of 6-hourly data, including February 29 2004
+    times = pd.date_range("2003-01-01T06", "2005-01-01T00", freq="6h")
+    rng = np.random.default_rng(0)
+    return xr.DataArray(
+        rng.gamma(2.0, 10.0, (times.size, 3)),
+        coords={"time": times, "station": ["A", "B", "C"]},
+        dims=("time", "station"),
+        name="dis",
+    )
+
+
+def _legacy_tool():
+    spec = importlib.util.spec_from_file_location("clim_benchmark", TOOL)
+    tool = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tool)
+    return tool
+
+
+def test_compute_climatology_matches_legacy_tool(discharge):
+    tool = _legacy_tool()
+    tool.core_dim = ["station"]
+    stride = 7
+    n_window = window_steps(30, 4, stride)
+    dates = tool.clim_dates(discharge.time.values, n_window)
+    day = 100
+    expected = []
+    for ihour in range(4):
+        samples = discharge.sel(
+            time=tool.dates_range(dates, n_window, 2, 365 * 4, day, ihour, 4, stride)
+        )
+        expected.append(np.percentile(samples.values, PERCENTILES, axis=0))
+
+    clim = compute_climatology(discharge, PERCENTILES, window=30, stride=stride)
+    assert clim.dims == ("time", "ensemble", "station")
+    assert clim.sizes["time"] == 366 * 4
+    assert clim.time.values[0] == "01-01T06"
+    # day 100 of a leap year is shifted by February 29
+    np.testing.assert_allclose(
+        clim.values[(day + 1) * 4 : (day + 2) * 4], np.stack(expected)
+    )
+    np.testing.assert_array_equal(clim.values[58 * 4 : 59 * 4], clim[59 * 4 : 60 * 4])
+
+
+def test_compute_climatology_chunks(discharge):
+    expected = compute_climatology(discharge, PERCENTILES)
+    chunked = compute_climatology(discharge, PERCENTILES, chunk_size=2)
+    xr.testing.assert_identical(chunked, expected)
+    assert np.all(expected.diff("ensemble") >= 0)
+
+
+def test_default_chunk_size(monkeypatch, discharge):
+    expected = compute_climatology(discharge, PERCENTILES, chunk_size=3)
+    # 2 years x 366 days x 31 samples at the same hour in a 30-day window
+    station_bytes = 2 * 366 * 31 * discharge.dtype.itemsize
+    monkeypatch.setattr(climatology_module, "BLOCK_BYTES", 2 * station_bytes + 1)
+    assert default_chunk_size(discharge) == 2
+    chunk_sizes = []
+    map_blocks = climatology_module._map_blocks
+
+    def spy(func, n_points, chunk_size, workers=1):
+        chunk_sizes.append(chunk_size)
+        map_blocks(func, n_points, chunk_size, workers)
+
+    monkeypatch.setattr(climatology_module, "_map_blocks", spy)
+    xr.testing.assert_identical(compute_climatology(discharge, PERCENTILES), expected)
+    assert chunk_sizes == [2]
+
+
+@pytest.mark.parametrize("stride", [1, 7])
+def test_sliding_method_matches_exact(discharge, stride):
+    pytest.importorskip("numba")
+    discharge[10:30, 1] = np.nan
+    discharge[200:204, 2] = 5.0
+    expected = compute_climatology(discharge, PERCENTILES, stride=stride)
+    sliding = compute_climatology(
+        discharge, PERCENTILES, stride=stride, method="sliding"
+    )
+    xr.testing.assert_allclose(sliding, expected)
+    assert np.isnan(sliding.values[:, :, 1]).any()
+
+
+def test_compute_climatology_writes_in_place(tmp_path, discharge):
+    expected = compute_climatology(discharge, PERCENTILES)
+    out = np.lib.format.open_memmap(
+        tmp_path / "clim.npy", mode="w+", shape=expected.shape
+    )
+    clim = compute_climatology(discharge, PERCENTILES, chunk_size=1, out=out, workers=3)
+    assert clim.data is out
+    xr.testing.assert_identical(clim, expected)
+    with pytest.raises(ValueError, match="does not match"):
+        compute_climatology(discharge, PERCENTILES, out=out[:, :5])
+
+
+def test_compute_climatology_needs_whole_years(discharge):
+    with pytest.raises(ValueError, match="whole years"):
+        compute_climatology(discharge.isel(time=slice(4, None)), PERCENTILES)
+    with pytest.raises(ValueError, match="No samples"):
+        compute_climatology(discharge, PERCENTILES, stride=4)
+    with pytest.raises(ValueError, match="Unknown climatology method"):
+        compute_climatology(discharge, PERCENTILES, method="sorted")
+
+
+def test_climatology_config(tmp_path, discharge):
+    discharge.to_dataset().to_netcdf(tmp_path / "dis.nc")
+    config = {
+        "input": {"source": {"file": {"path": str(tmp_path / "dis.nc")}}},
+        "window": 10,
+        "percentiles": [10, 50, 90],
+        "output": {"file": str(tmp_path / "clim.nc")},
+    }
+    clim = climatology(config)
+    written = xr.open_dataarray(tmp_path / "clim.nc")
+    np.testing.assert_allclose(written.values, clim.values)
+    assert list(written.percentile.values) == [10, 50, 90]
+
+
+def test_climatology_zarr_output(tmp_path, discharge):
+    pytest.importorskip("zarr")
+    discharge.to_dataset().to_netcdf(tmp_path / "dis.nc")
+    config = {
+        "input": {"source": {"file": {"path": str(tmp_path / "dis.nc")}}},
+        "chunk_size": 1,
+        "workers": 2,
+        "output": {"file": str(tmp_path / "clim.zarr")},
+    }
+    clim = climatology(config)
+    assert clim.chunks[2] == (1, 1, 1)
+    expected = compute_climatology(discharge, PERCENTILES)
+    np.testing.assert_array_equal(clim.values, expected.values)
+    assert list(clim.time.values) == list(expected.time.values)
+
+
+def test_sketch_quantiles_error():
+    rng = np.random.default_rng(0)
+    samples = rng.gamma(2.0, 10.0, (4, 20000))
+    mean, weight, vmin, vmax, n_missing = sketch.build(samples, compression=100)
+    assert mean.shape == (4, 50)
+    assert np.all(n_missing == 0)
+    result = sketch.quantiles(mean, weight, vmin, vmax, PERCENTILES)
+    ranks = (samples[:, None, :] < result[..., None]).mean(axis=-1)
+    assert np.abs(ranks - PERCENTILES / 100).max() < 0.005
+    np.testing.assert_array_equal(result[:, [0, -1]], np.stack([vmin, vmax], -1))
+
+
+@pytest.mark.parametrize("slice_samples", [4, 0.01])
+def test_sketch_method_with_exact_centroids(monkeypatch, discharge, slice_samples):
+    # with few samples per slice, every year is sketched and merged separately
+    monkeypatch.setattr(climatology_module, "SLICE_SAMPLES", slice_samples)
+    discharge[10:30, 1] = np.nan
+    expected = compute_climatology(discharge, PERCENTILES)
+    # with more centroids than samples the sketch keeps every sample
+    sketched = compute_climatology(
+        discharge, PERCENTILES, method="sketch", compression=1000
+    )
+    xr.testing.assert_allclose(sketched, expected)
+
+
+def test_climatology_sketches_by_year(tmp_path, discharge):
+    discharge.to_dataset().to_netcdf(tmp_path / "dis.nc")
+    config = {
+        "input": {"source": {"file": {"path": str(tmp_path / "dis.nc")}}},
+        "start": "2003-01-01T06",
+        "end": "2004-01-01T00",
+        "compression": 1000,
+        "sketch": {"file": str(tmp_path / "2003.nc")},
+    }
+    climatology(config)
+    config.update(
+        start="2004-01-01T06",
+        end="2005-01-01T00",
+        sketch={
+            "file": str(tmp_path / "all.nc"),
+            "merge": [str(tmp_path / "2003.nc")],
+        },
+        output={"file": str(tmp_path / "clim.nc")},
+    )
+    clim = climatology(config)
+    expected = compute_climatology(discharge, PERCENTILES)
+    xr.testing.assert_allclose(clim, expected)
+    written = xr.open_dataarray(tmp_path / "clim.nc")
+    np.testing.assert_allclose(written.values, expected.values)
+
+    first = climatology_sketch(discharge.sel(time=slice(None, "2004-01-01T00")))
+    with pytest.raises(ValueError, match="Cannot merge"):
+        merge_sketches([first, climatology_sketch(discharge, window=10)])
@@ -0,0 +1,74 @@
+"""Unit tests for source loading."""
+
+import os
+from unittest.mock import patch
+
+import earthkit.data as ekd
+import numpy as np
+import pytest
+import xarray as xr
+
+from hyve.core import clear_source_cache, configure_source_cache, load_da
+
+
+@pytest.fixture(autouse=True)
+def source_cache():
+    clear_source_cache()
+    yield
+    configure_source_cache()
+    clear_source_cache()
+
+
+def _write(path, offset=0.0):
+    ds = xr.Dataset(
+        {"dis": (("time", "station"), np.arange(6.0).reshape(3, 2) + offset)},
+        coords={"time": np.arange(3), "station": ["A", "B"]},
+    )
+    ds.to_netcdf(path)
+    return {"source": {"file": {"path": str(path)}}}
+
+
+def test_load_da_reuses_opened_source(tmp_path):
+    config = _write(tmp_path / "a.nc")
+    uncached = {**_write(tmp_path / "b.nc"), "cache": False}
+    with patch("earthkit.data.from_source", wraps=ekd.from_source) as from_source:
+        first, _ = load_da(config, 2)
+        second, _ = load_da(dict(config), 2)
+        load_da(uncached, 2)
+    assert from_source.call_count == 2
+    xr.testing.assert_identical(first, second)
+
+
+def test_load_da_reopens_changed_file(tmp_path):
+    config = _write(tmp_path / "a.nc")
+    first, _ = load_da(config, 2)
+    assert first.values[0, 0] == 0
+    _write(tmp_path / "b.nc", offset=10.0)
+    os.replace(tmp_path / "b.nc", tmp_path / "a.nc")
+    second, _ = load_da(config, 2)
+    assert second.values[0, 0] == 10
+
+
+def test_source_cache_lru_eviction(tmp_path):
+    configure_source_cache(max_entries=2)
+    configs = [_write(tmp_path / f"{i}.nc") for i in range(3)]
+    with patch("earthkit.data.from_source", wraps=ekd.from_source) as from_source:
+        for config in configs + [configs[2], configs[0]]:
+            load_da(config, 2)
+    # the first source was evicted by the third and is opened again
+    assert from_source.call_count == 4
+
+
+@pytest.mark.parametrize("fmt", ["netcdf", "zarr"])
+def test_disk_cache_skips_decoding(tmp_path, fmt):
+    if fmt == "zarr":
+        pytest.importorskip("zarr")
+    config = _write(tmp_path / "a.nc")
+    config["disk_cache"] = {"dir": str(tmp_path / "cache"), "format": fmt}
+    expected, _ = load_da(config, 2)
+    clear_source_cache()
+    with patch("earthkit.data.from_source") as from_source:
+        cached, _ = load_da(config, 2)
+    from_source.assert_not_called()
+    assert len(os.listdir(tmp_path / "cache")) == 1
+    np.testing.assert_array_equal(cached.values, expected.values)
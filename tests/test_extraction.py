@@ -1,5 +1,8 @@
 """Unit tests for the extractor function."""
 
+import contextlib
+import os
+import time
 from unittest.mock import Mock, patch
 
 import numpy as np
@@ -7,7 +10,17 @@ import pandas as pd
 import pytest
 import xarray as xr
 
-from hyve.extraction import extractor
+from hyve.cache import evict, load_mapping, save_mapping
+from hyve.extraction import (
+    batch_ranges,
+    coalesce_ranges,
+    construct_mask,
+    create_mask_from_coords,
+    extract_points,
+    extractor,
+    station_indices_from_index,
+)
+from hyve.mapping import EARTH_RADIUS_KM, nearest_grid_points
 
 
 @pytest.fixture
@@ -307,3 +320,536 @@ def test_extractor_gribjump(mock_from_source, tmp_path):
     # Verify output
     assert len(result.station) == 3
     assert list(result.station.values) == ["S1", "S2", "S3"]
+
+
+def test_create_mask_from_coords_matches_dense_argmin():
+    """Sorted axis search reproduces the dense argmin on the sorted axes."""
+    rng = np.random.default_rng(0)
+    gridx = np.array([43.0, 42.0, 41.0, 40.0])
+    gridy = np.array([10.0, 12.0, 11.0, 14.0, 13.0])
+    df = pd.DataFrame(
+        {"x_coord": rng.uniform(39, 44, 50), "y_coord": rng.uniform(9, 15, 50)}
+    )
+    df.loc[0, ["x_coord", "y_coord"]] = [41.5, 11.5]  # exact ties
+
+    mask, duplication_indexes = create_mask_from_coords(
+        df, gridx, gridy, (gridx.size, gridy.size)
+    )
+
+    x_order, y_order = np.argsort(gridx), np.argsort(gridy)
+    x_expected = x_order[
+        np.argmin(np.abs(df["x_coord"].values[:, None] - gridx[x_order]), axis=1)
+    ]
+    y_expected = y_order[
+        np.argmin(np.abs(df["y_coord"].values[:, None] - gridy[y_order]), axis=1)
+    ]
+    expected_mask, expected_dup = construct_mask(
+        x_expected, y_expected, (gridx.size, gridy.size)
+    )
+    np.testing.assert_array_equal(mask, expected_mask)
+    np.testing.assert_array_equal(duplication_indexes, expected_dup)
+
+
+def test_create_mask_from_coords_curvilinear():
+    """2D latitude/longitude arrays are matched by great-circle distance."""
+    lat2d, lon2d = np.meshgrid(
+        np.array([40.0, 41.0, 42.0]), np.array([10.0, 11.0]), indexing="ij"
+    )
+    lon2d = lon2d + 0.1 * lat2d  # skew the grid
+    df = pd.DataFrame({"x_coord": [41.05, 40.0, 41.0], "y_coord": [15.2, 14.1, 15.1]})
+
+    mask, duplication_indexes = create_mask_from_coords(df, lat2d, lon2d, (3, 2))
+
+    expected = np.zeros((3, 2), dtype=bool)
+    expected[1, 1] = expected[0, 0] = True
+    np.testing.assert_array_equal(mask, expected)
+    np.testing.assert_array_equal(duplication_indexes, [1, 0, 1])
+
+
+def test_nearest_grid_points_k_candidates():
+    """k nearest candidates are returned sorted by great-circle distance."""
+    grid_lat = np.array([0.0, 0.0, 0.0, 10.0])
+    grid_lon = np.array([0.0, 1.0, 2.0, 0.0])
+
+    distances, indices = nearest_grid_points([0.0], [0.9], grid_lat, grid_lon, k=3)
+
+    np.testing.assert_array_equal(indices, [[1, 0, 2]])
+    np.testing.assert_allclose(
+        distances[0], np.deg2rad([0.1, 0.9, 1.1]) * EARTH_RADIUS_KM, rtol=1e-9
+    )
+
+
+def test_extractor_mapping_cache(dummy_grid_data, station_csv_file, tmp_path):
+    """Second run reuses the cached mapping and skips the coordinate search."""
+    cache_dir = tmp_path / "cache"
+    config = {
+        "station": {
+            "file": station_csv_file,
+            "name": "station_id",
+            "coords": {"x": "opt_x_coord", "y": "opt_y_coord"},
+        },
+        "grid": {
+            "source": {"list-of-dicts": {"list_of_dicts": dummy_grid_data}},
+            "coords": {"x": "latitude", "y": "longitude"},
+        },
+        "cache": {"dir": str(cache_dir)},
+    }
+
+    first = extractor(config)
+    assert len(list(cache_dir.glob("*.npz"))) == 1
+
+    with patch("hyve.extraction.station_indices_from_coords") as mock_mapping:
+        second = extractor(config)
+    mock_mapping.assert_not_called()
+    xr.testing.assert_equal(first, second)
+
+    config["station"]["filter"] = "station_id == 'STATION_A'"
+    extractor(config)
+    assert len(list(cache_dir.glob("*.npz"))) == 2
+
+
+def test_mapping_cache_eviction(tmp_path):
+    """Entries are evicted by age and then least recently used by size."""
+    paths = [
+        save_mapping(tmp_path, f"key{i}", index_1d=np.arange(100)) for i in range(3)
+    ]
+    now = time.time()
+    for age, path in zip([1000, 20, 10], paths):
+        os.utime(path, (now - age, now - age))
+
+    assert evict(tmp_path, max_age=100) == [paths[0]]
+    assert load_mapping(tmp_path, "key1") is not None  # refreshes key1
+
+    assert evict(tmp_path, max_bytes=paths[1].stat().st_size) == [paths[2]]
+    assert [p.name for p in tmp_path.glob("*.npz")] == ["key1.npz"]
+
+
+@patch("hyve.core.ProgressBar", return_value=contextlib.nullcontext())
+def test_extractor_streaming(_, dummy_grid_data, station_csv_file, tmp_path):
+    """Streaming keeps the result lazy and writes it chunk by chunk."""
+    output_file = tmp_path / "output.nc"
+    config = {
+        "station": {
+            "file": station_csv_file,
+            "name": "station_id",
+            "index": {"x": "opt_x_index", "y": "opt_y_index"},
+        },
+        "grid": {
+            "source": {"list-of-dicts": {"list_of_dicts": dummy_grid_data}},
+            "coords": {"x": "latitude", "y": "longitude"},
+        },
+        "output": {"file": str(output_file), "streaming": True},
+    }
+
+    result_ds = extractor(config)
+
+    assert result_ds["temperature"].chunks is not None
+    with xr.open_dataset(output_file) as loaded_ds:
+        np.testing.assert_allclose(
+            loaded_ds["temperature"].sel(station="STATION_A").values, [17.0, 37.0]
+        )
+        xr.testing.assert_allclose(
+            result_ds["temperature"].load(), loaded_ds["temperature"]
+        )
+
+
+def test_extract_points_dask_blocks():
+    """Points are gathered in station order from spatially chunked dask arrays."""
+    values = np.arange(3 * 4 * 5, dtype=float).reshape(3, 4, 5)
+    da = xr.DataArray(values, dims=["time", "lat", "lon"]).chunk(
+        {"time": 1, "lat": 2, "lon": 2}
+    )
+    index_1d = np.array([19, 0, 7, 0])  # duplicates, unsorted
+
+    result = extract_points(da, index_1d, "lat", "lon", (4, 5), compute=False)
+
+    assert result.dims == ("time", "station")
+    assert result.chunks is not None
+    np.testing.assert_array_equal(result.values, values.reshape(3, -1)[:, index_1d])
+
+
+@pytest.mark.parametrize(
+    "mapping_config",
+    [
+        {"index": {"x": "opt_x_index", "y": "opt_y_index"}},
+        {"coords": {"x": "opt_x_coord", "y": "opt_y_coord"}},
+    ],
+    ids=["index", "coords"],
+)
+def test_extractor_descending_latitude(
+    dummy_grid_data, station_csv_file, mapping_config
+):
+    """Descending grids are read in native order with station indices remapped."""
+    for field in dummy_grid_data:
+        field["values"] = field["values"].reshape(4, 5)[::-1].flatten()
+        field["distinctLatitudes"] = field["distinctLatitudes"][::-1]
+    config = {
+        "station": {"file": station_csv_file, "name": "station_id", **mapping_config},
+        "grid": {
+            "source": {"list-of-dicts": {"list_of_dicts": dummy_grid_data}},
+            "coords": {"x": "latitude", "y": "longitude"},
+        },
+    }
+
+    with (
+        patch("xarray.DataArray.sortby") as mock_da_sortby,
+        patch("xarray.Dataset.sortby") as mock_ds_sortby,
+    ):
+        result_ds = extractor(config)
+    mock_da_sortby.assert_not_called()
+    mock_ds_sortby.assert_not_called()
+
+    np.testing.assert_allclose(
+        result_ds["temperature"].sel(station="STATION_A").values, [17.0, 37.0]
+    )
+    np.testing.assert_allclose(
+        result_ds["temperature"].sel(station="STATION_B").values, [23.0, 43.0]
+    )
+
+
+def test_coalesce_and_batch_ranges():
+    """Adjacent indices merge into ranges, which are split into bounded batches."""
+    ranges = coalesce_ranges(np.array([3, 4, 5, 9, 11, 12]))
+    assert ranges == [(3, 6), (9, 10), (11, 13)]
+    assert batch_ranges(ranges, None) == [ranges]
+    assert batch_ranges(ranges, 2) == [[(3, 5)], [(5, 6), (9, 10)], [(11, 13)]]
+    for batch_size in (0, -1):
+        with pytest.raises(ValueError, match="at least 1"):
+            batch_ranges(ranges, batch_size)
+
+
+@patch("earthkit.data.from_source")
+def test_extractor_gribjump_batches(mock_from_source, tmp_path):
+    """Concurrent gribjump batches are reassembled in station order."""
+
+    def from_source(name, ranges, **kwargs):
+        index = np.concatenate([np.arange(start, end) for start, end in ranges])
+        source = Mock()
+        source.to_xarray.return_value = xr.Dataset(
+            {
+                "temperature": xr.DataArray(
+                    np.stack([index, index + 0.5], axis=1).astype(float),
+                    dims=["index", "time"],
+                )
+            }
+        )
+        return source
+
+    mock_from_source.side_effect = from_source
+
+    csv_file = tmp_path / "stations.csv"
+    idx = [7, 100, 101, 102, 5, 101]
+    pd.DataFrame({"name": [f"S{i}" for i in range(6)], "idx": idx}).to_csv(
+        csv_file, index=False
+    )
+    config = {
+        "station": {"file": str(csv_file), "name": "name", "index_1d": "idx"},
+        "grid": {
+            "source": {"gribjump": {"request": {"class": "od"}}},
+            "gribjump_batch": {"size": 2, "workers": 3},
+        },
+    }
+
+    result = extractor(config)
+
+    assert mock_from_source.call_count == 3
+    assert list(result.station.values) == [f"S{i}" for i in range(6)]
+    np.testing.assert_array_equal(result["temperature"].isel(time=0).values, idx)
+
+
+@pytest.mark.parametrize("variables", ["all", ["temperature", "runoff"]])
+def test_extractor_multiple_variables(dummy_grid_data, station_csv_file, variables):
+    """Several variables are extracted with one mask into one dataset."""
+    runoff_data = [
+        {**field, "param": "runoff", "values": field["values"] * 10}
+        for field in dummy_grid_data
+    ]
+    config = {
+        "station": {
+            "file": station_csv_file,
+            "name": "station_id",
+            "index": {"x": "opt_x_index", "y": "opt_y_index"},
+        },
+        "grid": {
+            "source": {
+                "list-of-dicts": {"list_of_dicts": dummy_grid_data + runoff_data}
+            },
+            "coords": {"x": "latitude", "y": "longitude"},
+            "variables": variables,
+        },
+    }
+
+    result_ds = extractor(config)
+
+    assert set(result_ds.data_vars) == {"temperature", "runoff"}
+    np.testing.assert_allclose(
+        result_ds["runoff"].sel(station="STATION_A").values, [170.0, 370.0]
+    )
+    np.testing.assert_allclose(
+        result_ds["temperature"].sel(station="STATION_B").values, [23.0, 43.0]
+    )
+
+
+def test_extractor_missing_variable(dummy_grid_data, station_csv_file):
+    """Requesting an unknown variable raises a clear error."""
+    config = {
+        "station": {
+            "file": station_csv_file,
+            "name": "station_id",
+            "index": {"x": "opt_x_index", "y": "opt_y_index"},
+        },
+        "grid": {
+            "source": {"list-of-dicts": {"list_of_dicts": dummy_grid_data}},
+            "coords": {"x": "latitude", "y": "longitude"},
+            "variables": ["temperature", "runoff"],
+        },
+    }
+
+    with pytest.raises(ValueError, match=r"Variables \['runoff'\] not found"):
+        extractor(config)
+
+
+@pytest.fixture
+def grid_files(tmp_path):
+    """Three NetCDF grid files on the same 4x5 grid with distinct values."""
+    paths = []
+    for i in range(3):
+        da = xr.DataArray(
+            np.arange(2 * 4 * 5, dtype=float).reshape(2, 4, 5) + 100 * i,
+            dims=["time", "latitude", "longitude"],
+            coords={
+                "time": pd.date_range("2024-01-01", periods=2),
+                "latitude": [40.0, 41.0, 42.0, 43.0],
+                "longitude": [10.0, 11.0, 12.0, 13.0, 14.0],
+            },
+            name="dis",
+        )
+        path = tmp_path / f"grid_{i}.nc"
+        da.to_netcdf(path)
+        paths.append(path)
+    return paths
+
+
+@patch("hyve.core.ProgressBar", return_value=contextlib.nullcontext())
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_batch_extractor_concat(_, grid_files, station_csv_file, tmp_path, executor):
+    """Sources are extracted with one station mapping and concatenated."""
+    output_file = tmp_path / "batch.nc"
+    config = {
+        "station": {
+            "file": station_csv_file,
+            "name": "station_id",
+            "index": {"x": "opt_x_index", "y": "opt_y_index"},
+        },
+        "grid": {
+            "source": {"file": {}},
+            "coords": {"x": "latitude", "y": "longitude"},
+        },
+        "batch": {
+            "sources": str(tmp_path / "grid_*.nc"),
+            "workers": 2,
+            "executor": executor,
+            "concat_dim": "source",
+        },
+        "output": {"file": str(output_file)},
+    }
+
+    with patch(
+        "hyve.extraction.station_indices_from_index",
+        wraps=station_indices_from_index,
+    ) as mock_mapping:
+        result_ds = extractor(config)
+
+    if executor == "thread":
+        mock_mapping.assert_called_once()
+    assert list(result_ds.source.values) == ["grid_0", "grid_1", "grid_2"]
+    np.testing.assert_allclose(
+        result_ds["dis"].sel(station="STATION_A").isel(time=0).values,
+        [7.0, 107.0, 207.0],
+    )
+    assert output_file.exists()
+
+
+@patch("hyve.core.ProgressBar", return_value=contextlib.nullcontext())
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_batch_extractor_per_source_output(
+    _, grid_files, station_csv_file, tmp_path, executor
+):
+    """Without concat_dim, one output is written per source and its path returned."""
+    config = {
+        "station": {
+            "file": station_csv_file,
+            "name": "station_id",
+            "index": {"x": "opt_x_index", "y": "opt_y_index"},
+        },
+        "grid": {
+            "source": {"file": {}},
+            "coords": {"x": "latitude", "y": "longitude"},
+        },
+        "batch": {
+            "sources": [str(path) for path in grid_files],
+            "workers": 2,
+            "executor": executor,
+        },
+        "output": {"file": str(tmp_path / "out_{stem}.nc"), "streaming": True},
+    }
+
+    results = extractor(config)
+
+    assert results == [str(tmp_path / f"out_grid_{i}.nc") for i in range(3)]
+    for i, path in enumerate(results):
+        with xr.open_dataset(path) as loaded_ds:
+            np.testing.assert_allclose(
+                loaded_ds["dis"].sel(station="STATION_A").values,
+                [7.0 + 100 * i, 27.0 + 100 * i],
+            )
+
+    config["output"]["file"] = str(tmp_path / "out.nc")
+    with pytest.raises(ValueError, match="placeholder"):
+        extractor(config)
+
+
+@pytest.mark.parametrize(
+    "mapping_config",
+    [
+        {"coords": {"x": "opt_x_coord", "y": "opt_y_coord"}},
+        {"index_1d": "opt_index_1d"},
+    ],
+    ids=["coords", "index_1d"],
+)
+@patch("hyve.core.ProgressBar", return_value=contextlib.nullcontext())
+def test_extractor_unstructured_grid(_, tmp_path, mapping_config):
+    """Grids with a single spatial dimension are mapped by great-circle distance."""
+    lats = np.array([60.0, 60.0, 60.0, 0.0, 0.0, 0.0, -60.0])
+    lons = np.array([0.0, 120.0, 240.0, 0.0, 180.0, 359.0, 0.0])
+    values = np.stack([np.arange(7.0), np.arange(7.0) + 10])
+    grid_file = tmp_path / "grid.nc"
+    xr.Dataset(
+        {"dis": (("time", "values"), values)},
+        coords={
+            "time": pd.date_range("2024-01-01", periods=2),
+            "latitude": ("values", lats),
+            "longitude": ("values", lons),
+        },
+    ).to_netcdf(grid_file)
+
+    csv_file = tmp_path / "stations.csv"
+    pd.DataFrame(
+        {
+            "name": ["S1", "S2", "S3"],
+            "opt_x_coord": [59.0, 0.5, 1.0],
+            "opt_y_coord": [235.0, -0.9, 179.0],
+            "opt_index_1d": [2, 5, 4],
+        }
+    ).to_csv(csv_file, index=False)
+    config = {
+        "station": {"file": str(csv_file), "name": "name", **mapping_config},
+        "grid": {
+            "source": {"file": {"path": str(grid_file)}},
+            "coords": {"x": "values", "y": None},
+        },
+    }
+
+    result_ds = extractor(config)
+
+    assert result_ds["dis"].dims == ("time", "station")
+    np.testing.assert_array_equal(result_ds["dis"].isel(time=0).values, [2, 5, 4])
+
+
+@patch("hyve.core.ProgressBar", return_value=contextlib.nullcontext())
+@pytest.mark.parametrize("suffix", [".nc", ".zarr"])
+def test_extractor_append(_, station_csv_file, tmp_path, suffix):
+    """Append mode only extracts and writes the steps after the existing output."""
+    times = pd.date_range("2024-01-01", periods=5)
+    values = np.arange(5 * 4 * 5, dtype=float).reshape(5, 4, 5)
+    grid = xr.DataArray(
+        values,
+        dims=["time", "latitude", "longitude"],
+        coords={
+            "time": times,
+            "latitude": [40.0, 41.0, 42.0, 43.0],
+            "longitude": [10.0, 11.0, 12.0, 13.0, 14.0],
+        },
+        name="dis",
+    )
+    grid.isel(time=slice(0, 3)).to_netcdf(tmp_path / "archive_old.nc")
+    grid.to_netcdf(tmp_path / "archive_new.nc")
+    output_file = tmp_path / f"output{suffix}"
+    config = {
+        "station": {
+            "file": station_csv_file,
+            "name": "station_id",
+            "index": {"x": "opt_x_index", "y": "opt_y_index"},
+        },
+        "grid": {
+            "source": {"file": {"path": str(tmp_path / "archive_old.nc")}},
+            "coords": {"x": "latitude", "y": "longitude"},
+        },
+        "output": {"file": str(output_file), "append": True},
+    }
+
+    assert len(extractor(config).time) == 3
+    config["grid"]["source"]["file"]["path"] = str(tmp_path / "archive_new.nc")
+    appended = extractor(config)
+    assert list(appended.time.values) == list(times.values[3:])
+    assert len(extractor(config).time) == 0
+
+    opener = xr.open_zarr if suffix == ".zarr" else xr.open_dataset
+    with opener(output_file) as loaded_ds:
+        assert list(loaded_ds.time.values) == list(times.values)
+        np.testing.assert_allclose(
+            loaded_ds["dis"].sel(station="STATION_A").values, values[:, 1, 2]
+        )
+
+
+@patch("hyve.core.ProgressBar", return_value=contextlib.nullcontext())
+@pytest.mark.parametrize("streaming", [False, True], ids=["eager", "streaming"])
+@pytest.mark.parametrize(
+    "output_config",
+    [
+        {
+            "file": "out.nc",
+            "compression": {"complevel": 5},
+            "storage_chunks": {"station": 1, "time": 2},
+        },
+        {"file": "out.zarr", "storage_chunks": {"station": 1, "time": 1}},
+        {"file": "out.parquet", "compression": {"codec": "snappy"}},
+    ],
+    ids=["netcdf", "zarr", "parquet"],
+)
+def test_extractor_output_backends(
+    _, grid_files, station_csv_file, tmp_path, output_config, streaming
+):
+    """Each backend writes the extracted values with its storage settings."""
+    output_file = tmp_path / output_config["file"]
+    config = {
+        "station": {
+            "file": station_csv_file,
+            "name": "station_id",
+            "index": {"x": "opt_x_index", "y": "opt_y_index"},
+        },
+        "grid": {
+            "source": {"file": {"path": str(grid_files[0])}},
+            "coords": {"x": "latitude", "y": "longitude"},
+        },
+        "output": {**output_config, "file": str(output_file), "streaming": streaming},
+    }
+
+    extractor(config)
+
+    if output_file.suffix == ".parquet":
+        df = pd.read_parquet(output_file)
+        station_a = df[df["station"] == "STATION_A"].sort_values("time")
+        np.testing.assert_allclose(station_a["dis"].values, [7.0, 27.0])
+        return
+    opener = xr.open_zarr if output_file.suffix == ".zarr" else xr.open_dataset
+    with opener(output_file) as loaded_ds:
+        np.testing.assert_allclose(
+            loaded_ds["dis"].sel(station="STATION_A").values, [7.0, 27.0]
+        )
+        encoding = loaded_ds["dis"].encoding
+        if output_file.suffix == ".nc":
+            assert encoding["zlib"] and encoding["complevel"] == 5
+            assert encoding["chunksizes"] == (2, 1)
+        else:
+            assert encoding["chunks"] == (1, 1)
@@ -0,0 +1,429 @@
+"""Unit tests for the hydrostats statistics."""
+
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from hyve.hydrostats import stat_calc as stat_calc_module
+from hyve.hydrostats import stats
+from hyve.hydrostats.bootstrap import block_accumulators, bootstrap_stats
+from hyve.hydrostats.moments import (
+    FUSED_STATS,
+    accumulate,
+    from_sums,
+    fused_stats,
+    rolling_stats,
+    to_sums,
+    tree_reduce,
+)
+from hyve.hydrostats.probabilistic import crps, crps_ensemble_np, rank_histogram
+from hyve.hydrostats.stat_calc import find_valid_subset, grouped_stats, stat_calc
+
+
+@pytest.fixture
+def sim_obs():
+    """Discharge-like sim and obs for 6 stations over 50 days, with gaps."""
+    rng = np.random.default_rng(42)
+    times = pd.date_range("2024-01-01", periods=50, freq="D")
+    stations = [f"S{i}" for i in range(6)]
+    obs = rng.gamma(2.0, 50.0, size=(50, 6))
+    sim = obs * rng.normal(1.1, 0.2, size=(50, 6)) + rng.normal(0, 5, (50, 6))
+    obs[rng.random((50, 6)) < 0.1] = np.nan
+    sim[rng.random((50, 6)) < 0.1] = np.nan
+    # a station with a single valid pair
+    obs[1:, 5] = np.nan
+    coords = {"time": times, "station": stations}
+    sim_da = xr.DataArray(sim, coords=coords, dims=["time", "station"])
+    obs_da = xr.DataArray(obs, coords=coords, dims=["time", "station"])
+    return sim_da, obs_da
+
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+@pytest.mark.parametrize("chunked", [False, True])
+def test_fused_stats_match_xarray_stats(sim_obs, chunked, backend):
+    if backend == "numba":
+        pytest.importorskip("numba")
+    sim_da, obs_da = sim_obs
+    if chunked:
+        sim_da = sim_da.chunk({"station": 2})
+        obs_da = obs_da.chunk({"station": 2})
+    result = fused_stats(sim_da, obs_da, "time", FUSED_STATS, backend=backend)
+    for stat in FUSED_STATS:
+        expected = getattr(stats, stat)(sim_da, obs_da, "time")
+        np.testing.assert_allclose(
+            result[stat].values, expected.values, rtol=1e-10, err_msg=stat
+        )
+
+
+def test_fused_stats_unsupported(sim_obs):
+    with pytest.raises(ValueError, match="not supported"):
+        fused_stats(*sim_obs, "time", ["kge", "made_up"])
+
+
+@pytest.mark.parametrize("engine", ["fused", "xarray"])
+def test_stat_calc(sim_obs, tmp_path, engine):
+    sim_da, obs_da = sim_obs
+    sim_da.rename("dis").to_dataset().to_netcdf(tmp_path / "sim.nc")
+    obs_ds = obs_da.rename({"time": "date", "station": "id"}).to_dataset(name="q")
+    obs_ds.to_netcdf(tmp_path / "obs.nc")
+    config = {
+        "sim": {"source": {"file": {"path": str(tmp_path / "sim.nc")}}, "coords": {}},
+        "obs": {
+            "source": {"file": {"path": str(tmp_path / "obs.nc")}},
+            "coords": {"t": "date", "s": "id"},
+        },
+        "stats": ["kge", "nse", "rmse", "spearman"],
+        "engine": engine,
+        "output": {"coords": {}, "file": str(tmp_path / "stats.nc")},
+    }
+    ds = stat_calc(config)
+    assert set(ds.data_vars) == {"kge", "nse", "rmse", "spearman"}
+    np.testing.assert_allclose(
+        ds["kge"].values, stats.kge(sim_da, obs_da, "time").values
+    )
+    assert os.path.exists(tmp_path / "stats.nc")
+
+
+def test_correlation_matches_corrcoef(sim_obs):
+    sim_da, obs_da = sim_obs
+    result = stats.correlation(sim_da.chunk({"time": 10}), obs_da, "time")
+    for i in range(sim_da.sizes["station"]):
+        a = sim_da.isel(station=i).values
+        b = obs_da.isel(station=i).values
+        mask = ~np.isnan(a) & ~np.isnan(b)
+        expected = np.corrcoef(a[mask], b[mask])[0, 1] if mask.sum() >= 2 else np.nan
+        np.testing.assert_allclose(result.values[i], expected)
+
+
+@pytest.mark.parametrize("chunks", [None, {"time": 10}])
+def test_spearman_matches_scipy(sim_obs, chunks):
+    from scipy.stats import spearmanr
+
+    sim_da, obs_da = sim_obs
+    if chunks is not None:
+        sim_da, obs_da = sim_da.chunk(chunks), obs_da.chunk(chunks)
+    result = stats.spearman(sim_da, obs_da, "time")
+    for i in range(sim_da.sizes["station"] - 1):
+        a = sim_da.isel(station=i).values
+        b = obs_da.isel(station=i).values
+        mask = ~np.isnan(a) & ~np.isnan(b)
+        np.testing.assert_allclose(
+            result.values[i], spearmanr(a[mask], b[mask]).statistic
+        )
+    assert np.isnan(result.values[-1])
+
+
+def test_merged_accumulators_match_single_pass(sim_obs):
+    sim_da, obs_da = sim_obs
+    expected = accumulate(sim_da, obs_da, "time")
+    # uneven blocks, including one where a station has no valid pairs
+    blocks = [slice(0, 1), slice(1, 17), slice(17, 18), slice(18, 50)]
+    partials = [
+        accumulate(sim_da.isel(time=block), obs_da.isel(time=block), "time")
+        for block in blocks
+    ]
+    merged = tree_reduce(partials)
+    for field in expected.data_vars:
+        np.testing.assert_allclose(
+            merged[field].values, expected[field].values, rtol=1e-10, err_msg=field
+        )
+
+
+@pytest.mark.parametrize(
+    "chunks, block_size",
+    [({"time": 8}, None), (None, 7), (None, 50), ({"time": 8}, 20), ({"time": 8}, 50)],
+)
+def test_fused_stats_time_blocks(sim_obs, chunks, block_size):
+    sim_da, obs_da = sim_obs
+    if chunks:
+        sim_da, obs_da = sim_da.chunk(chunks), obs_da.chunk(chunks)
+    result = fused_stats(sim_da, obs_da, "time", FUSED_STATS, block_size, "numpy")
+    for stat in FUSED_STATS:
+        expected = getattr(stats, stat)(sim_da, obs_da, "time")
+        np.testing.assert_allclose(
+            result[stat].values, expected.values, rtol=1e-10, err_msg=stat
+        )
+
+
+def test_unknown_backend(sim_obs):
+    with pytest.raises(ValueError, match="Unknown statistics backend"):
+        fused_stats(*sim_obs, "time", ["kge"], backend="fortran")
+
+
+@pytest.fixture
+def long_sim_obs():
+    """Two stations over 400 days with gaps."""
+    rng = np.random.default_rng(0)
+    times = pd.date_range("2023-01-01", periods=400, freq="D")
+    obs = rng.gamma(2.0, 50.0, size=(400, 2))
+    sim = obs + rng.normal(0, 20, size=(400, 2))
+    obs[rng.random((400, 2)) < 0.1] = np.nan
+    coords = {"time": times, "station": ["A", "B"]}
+    return (
+        xr.DataArray(sim, coords=coords, dims=["time", "station"]),
+        xr.DataArray(obs, coords=coords, dims=["time", "station"]),
+    )
+
+
+@pytest.mark.parametrize("engine", ["fused", "xarray"])
+def test_grouped_stats_by_month(long_sim_obs, engine):
+    sim_da, obs_da = long_sim_obs
+    result = grouped_stats(
+        sim_da, obs_da, "time", ["kge", "index_agreement"], "time.month", engine=engine
+    )
+    assert list(result["kge"]["month"].values) == list(range(1, 13))
+    for month, group in sim_da.groupby("time.month"):
+        obs_group = obs_da.sel(time=group.time)
+        for stat in ["kge", "index_agreement"]:
+            np.testing.assert_allclose(
+                result[stat].sel(month=month).values,
+                getattr(stats, stat)(group, obs_group, "time").values,
+                rtol=1e-10,
+            )
+
+
+def test_rolling_stats(long_sim_obs):
+    sim_da, obs_da = long_sim_obs
+    result = rolling_stats(sim_da, obs_da, "time", ["nse", "kge"], 3, "M")
+    # 14 months in the data, so 12 windows of 3 months
+    assert result["nse"].sizes["period"] == 12
+    assert result["nse"]["period"].values[0] == np.datetime64("2023-03-01")
+    window = slice("2023-06-01", "2023-08-31")
+    for stat in ["nse", "kge"]:
+        np.testing.assert_allclose(
+            result[stat].sel(period="2023-08-01").values,
+            getattr(stats, stat)(
+                sim_da.sel(time=window), obs_da.sel(time=window), "time"
+            ).values,
+            rtol=1e-10,
+        )
+    with pytest.raises(ValueError, match="not supported with rolling"):
+        rolling_stats(sim_da, obs_da, "time", ["index_agreement"], 3)
+
+
+def test_find_valid_subset_aligned_skips_gather(sim_obs):
+    sim_da, obs_da = sim_obs
+    sim_sub, obs_sub = find_valid_subset(sim_da, obs_da, {}, {}, {})
+    assert np.shares_memory(sim_sub.values, sim_da.values)
+    assert np.shares_memory(obs_sub.values, obs_da.values)
+
+
+def test_find_valid_subset_partial_overlap(sim_obs):
+    sim_da, obs_da = sim_obs
+    sim_da = sim_da.isel(station=[4, 0, 2, 5], time=slice(5, None))
+    obs_da = obs_da.isel(station=[5, 1, 2, 4], time=slice(None, 40))
+    obs_da = obs_da.rename({"time": "date", "station": "id"})
+    sim_sub, obs_sub = find_valid_subset(
+        sim_da, obs_da, {}, {"t": "date", "s": "id"}, {}
+    )
+    assert list(sim_sub["station"].values) == ["S2", "S4", "S5"]
+    assert sim_sub.sizes["time"] == 35
+    xr.testing.assert_equal(sim_sub["time"], obs_sub["time"])
+    xr.testing.assert_equal(sim_sub["station"], obs_sub["station"])
+    np.testing.assert_array_equal(
+        obs_sub.values,
+        obs_da.sel(id=["S2", "S4", "S5"], date=sim_sub["time"].values).values,
+    )
+
+
+def test_find_valid_subset_time_tolerance(sim_obs):
+    sim_da, obs_da = sim_obs
+    sim_da = sim_da.assign_coords(time=sim_da["time"] + pd.Timedelta("6h"))
+    sim_sub, obs_sub = find_valid_subset(sim_da, obs_da, {}, {}, {})
+    assert sim_sub.sizes["time"] == 0
+    sim_sub, obs_sub = find_valid_subset(
+        sim_da, obs_da, {}, {}, {}, time_tolerance="6h"
+    )
+    assert sim_sub.sizes["time"] == 50
+    xr.testing.assert_equal(sim_sub["time"], obs_sub["time"])
+    np.testing.assert_array_equal(obs_sub.values, obs_da.values)
+
+
+def test_find_valid_subset_nearest_sim_time():
+    # 6-hourly sim around daily obs: each obs day pairs with its closest step
+    sim_times = pd.date_range("2024-01-01T06", periods=12, freq="6h")
+    obs_times = pd.date_range("2024-01-01", periods=4, freq="D")
+    sim_da = xr.DataArray(
+        np.arange(12.0)[:, None], coords={"time": sim_times}, dims=["time", "station"]
+    ).assign_coords(station=["S0"])
+    obs_da = xr.DataArray(
+        np.arange(4.0)[:, None], coords={"time": obs_times}, dims=["time", "station"]
+    ).assign_coords(station=["S0"])
+    sim_sub, obs_sub = find_valid_subset(
+        sim_da, obs_da, {}, {}, {}, time_tolerance="6h"
+    )
+    np.testing.assert_array_equal(obs_sub.values[:, 0], [0.0, 1.0, 2.0, 3.0])
+    # later days match a 00Z step exactly rather than the 18Z step before
+    np.testing.assert_array_equal(sim_sub.values[:, 0], [0.0, 3.0, 7.0, 11.0])
+    xr.testing.assert_equal(sim_sub["time"], obs_sub["time"])
+
+
+def test_block_sums_roundtrip(long_sim_obs):
+    sim_da, obs_da = long_sim_obs
+    acc = block_accumulators(sim_da, obs_da, "time", 30)
+    assert acc.sizes["block"] == 14
+    sums, shifts = to_sums(acc, "block")
+    merged = from_sums(sums.sum("block"), shifts)
+    expected = accumulate(sim_da, obs_da, "time")
+    for field in expected.data_vars:
+        np.testing.assert_allclose(
+            merged[field].values, expected[field].values, rtol=1e-9, err_msg=field
+        )
+
+
+def test_bootstrap_stats(long_sim_obs):
+    sim_da, obs_da = long_sim_obs
+    kwargs = dict(n_resamples=200, block_length=20, seed=1, quantiles=[0.025, 0.975])
+    result = bootstrap_stats(sim_da, obs_da, "time", ["kge", "nse"], **kwargs)
+    assert result["kge_ci"].dims == ("quantile", "station")
+    for stat in ["kge", "nse"]:
+        point = getattr(stats, stat)(sim_da, obs_da, "time")
+        lower, upper = result[f"{stat}_ci"].values
+        assert np.all(lower < point.values) and np.all(point.values < upper)
+    again = bootstrap_stats(sim_da, obs_da, "time", ["kge", "nse"], **kwargs)
+    xr.testing.assert_identical(result["kge_ci"], again["kge_ci"])
+
+
+def test_score_bootstrap_subset(long_sim_obs):
+    sim_da, obs_da = long_sim_obs
+    bootstrap = {"n_resamples": 50, "block_length": 20, "seed": 0}
+    config = {"stats": ["kge", "index_agreement", "spearman"], "bootstrap": bootstrap}
+    ds = stat_calc_module._score(sim_da, obs_da, "time", config)
+    assert {"kge_ci", "index_agreement", "spearman"} <= set(ds.data_vars)
+    assert "spearman_ci" not in ds
+    config["bootstrap"] = {**bootstrap, "stats": ["nse"]}
+    ds = stat_calc_module._score(sim_da, obs_da, "time", config)
+    assert "nse_ci" in ds and "kge_ci" not in ds
+    with pytest.raises(ValueError, match="cannot be combined"):
+        stat_calc_module._score(
+            sim_da, obs_da, "time", {**config, "groupby": "time.month"}
+        )
+
+
+def _pairwise_crps(ens, obs, fair=False):
+    ens = ens[~np.isnan(ens)]
+    m = ens.size
+    spread = np.abs(ens[:, None] - ens[None, :]).sum()
+    norm = m * (m - 1) if fair else m * m
+    return np.abs(ens - obs).mean() - spread / (2 * norm)
+
+
+@pytest.mark.parametrize("fair", [False, True])
+def test_crps_ensemble_matches_pairwise(fair):
+    rng = np.random.default_rng(3)
+    ens = rng.normal(size=(20, 11))
+    obs = rng.normal(size=20)
+    ens[0, [2, 5]] = np.nan
+    obs[1] = np.nan
+    result = crps_ensemble_np(ens, obs, fair=fair)
+    expected = [_pairwise_crps(e, o, fair) for e, o in zip(ens, obs)]
+    np.testing.assert_allclose(result, expected)
+    assert np.isnan(result[1])
+
+
+@pytest.fixture
+def ensemble_obs(long_sim_obs):
+    rng = np.random.default_rng(5)
+    _, obs_da = long_sim_obs
+    noise = xr.DataArray(rng.normal(0, 20, size=(10,)), dims="ensemble")
+    ens_da = (obs_da.fillna(100) + noise).transpose("time", "station", "ensemble")
+    return ens_da, obs_da
+
+
+def test_crps_deterministic_is_mae(long_sim_obs):
+    sim_da, obs_da = long_sim_obs
+    np.testing.assert_allclose(
+        crps(sim_da, obs_da, "time").values, stats.mae(sim_da, obs_da, "time").values
+    )
+
+
+def test_rank_histogram(ensemble_obs):
+    ens_da, obs_da = ensemble_obs
+    hist = rank_histogram(ens_da.chunk({"time": 100}), obs_da, "time")
+    assert hist.sizes["rank"] == 11
+    np.testing.assert_array_equal(
+        hist.sum("rank").values, obs_da.notnull().sum("time").values
+    )
+
+
+def test_rank_histogram_ties():
+    # zero flows tie with the observation, all members in the first forecast
+    ens_da = xr.DataArray(
+        [[0.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.5, 2.0, 3.0]],
+        dims=("time", "ensemble"),
+    )
+    obs_da = xr.DataArray([0.0, 0.0, 1.0], dims="time")
+    hist = rank_histogram(ens_da, obs_da, "time")
+    np.testing.assert_allclose(
+        hist.values, [1 / 4 + 1 / 3, 1 / 4 + 1 + 1 / 3, 1 / 4 + 1 / 3, 1 / 4]
+    )
+    with pytest.raises(ValueError, match="ensemble forecasts"):
+        rank_histogram(ens_da.isel(ensemble=0), obs_da, "time")
+
+
+def test_stat_calc_probabilistic(ensemble_obs, long_sim_obs, tmp_path):
+    ens_da, obs_da = ensemble_obs
+    ens_da.to_dataset(name="dis").to_netcdf(tmp_path / "sim.nc")
+    obs_da.to_dataset(name="dis").to_netcdf(tmp_path / "obs.nc")
+    reference_da = long_sim_obs[0]
+    reference_da.to_dataset(name="dis").to_netcdf(tmp_path / "ref.nc")
+    config = {
+        "sim": {"source": {"file": {"path": str(tmp_path / "sim.nc")}}, "coords": {}},
+        "obs": {"source": {"file": {"path": str(tmp_path / "obs.nc")}}, "coords": {}},
+        "reference": {
+            "source": {"file": {"path": str(tmp_path / "ref.nc")}},
+            "coords": {},
+        },
+        "stats": ["crps", "fair_crps", "crpss", "rank_histogram"],
+        "output": {"coords": {}},
+    }
+    ds = stat_calc(config)
+    expected = 1 - crps(ens_da, obs_da, "time") / crps(reference_da, obs_da, "time")
+    np.testing.assert_allclose(ds["crpss"].values, expected.values)
+    assert np.all(ds["fair_crps"] < ds["crps"])
+    assert ds["rank_histogram"].dims == ("station", "rank")
+
+
+def test_stat_calc_multi_sim(sim_obs, tmp_path):
+    sim_da, obs_da = sim_obs
+    obs_da.to_dataset(name="dis").to_netcdf(tmp_path / "obs.nc")
+    sims = {
+        "base": sim_da,
+        "scaled": sim_da * 1.2,
+        "subset": sim_da.isel(station=[0, 2, 4]),
+    }
+    for name, da in sims.items():
+        da.to_dataset(name="dis").to_netcdf(tmp_path / f"{name}.nc")
+    config = {
+        "sim": [
+            {
+                "name": name,
+                "source": {"file": {"path": str(tmp_path / f"{name}.nc")}},
+                "coords": {},
+            }
+            for name in sims
+        ],
+        "obs": {"source": {"file": {"path": str(tmp_path / "obs.nc")}}, "coords": {}},
+        "stats": ["kge", "rmse"],
+        "workers": 3,
+        "output": {"coords": {}},
+    }
+    with patch(
+        "hyve.hydrostats.stat_calc.alignment_positions",
+        wraps=stat_calc_module.alignment_positions,
+    ) as positions:
+        ds = stat_calc(config)
+    # base and scaled share stations and times
+    assert positions.call_count == 2
+    assert list(ds["experiment"].values) == ["base", "scaled", "subset"]
+    for name, da in sims.items():
+        expected = stats.kge(da, obs_da.sel(station=da["station"]), "time")
+        np.testing.assert_allclose(
+            ds["kge"].sel(experiment=name, station=da["station"]).values,
+            expected.values,
+        )
+    assert ds["kge"].sel(experiment="subset", station="S1").isnull()
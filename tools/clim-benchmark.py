@@ -2,11 +2,14 @@
 
 import argparse
 import logging as log
+import time
 
 import dask
 import numpy as np
 import xarray as xr
 
+from hyve import climatology
+
 
 def percentile_ufunc(data, p_values, axis):
     log.debug("Computing percentiles for array of size " + str(data.shape))
@@ -208,6 +211,12 @@ if __name__ == "__main__":
         choices=["synchronous", "threads"],
         help="reanalysis dataset file",
     )
+    parser.add_argument(
+        "--engine",
+        default="vectorized",
+        choices=["legacy", "vectorized", "sliding"],
+        help="climatology engine, legacy is the per-day loop",
+    )
     parser.add_argument(
         "--log",
         default="INFO",
@@ -231,6 +240,7 @@ if __name__ == "__main__":
     log.info(" - timestep: {}".format(args.timestep))
     log.info(" - stride: {}".format(args.stride))
     log.info(" - n_days: {}".format(args.n_days))
+    log.info(" - engine: {}".format(args.engine))
 
     freq = int(24 / args.timestep)
     log.info("Computing climatology using {} steps per day".format(freq))
@@ -261,11 +271,23 @@ if __name__ == "__main__":
         )
         log.info("discharge dataset {}".format(dis))
 
-        dates = clim_dates(dis.time.values, step_window)
-        dates_index = np.arange(dates.size, dtype=int)
-
-        clim = compute_climatology(
-            p_values, n_days, step_window, freq, stride, dates, dis
+        start_time = time.perf_counter()
+        if args.engine == "legacy":
+            dates = clim_dates(dis.time.values, step_window)
+            clim = compute_climatology(
+                p_values, n_days, step_window, freq, stride, dates, dis
+            )
+        else:
+            clim = climatology.compute_climatology(
+                dis,
+                p_values,
+                window,
+                stride,
+                n_days,
+                method="sliding" if args.engine == "sliding" else "exact",
+            ).rename("dis")
+        log.info(
+            "Climatology computed in {:.2f}s".format(time.perf_counter() - start_time)
         )
 
         clim.to_netcdf(args.output)
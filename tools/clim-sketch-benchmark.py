@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging as log
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hyve.climatology import (
+    climatology_sketch,
+    compute_climatology,
+    merge_sketches,
+    sketch_percentiles,
+)
+
+
+def synthetic_data(n_stations, first_year, n_years, seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(
+        f"{first_year}-01-01T06", f"{first_year + n_years}-01-01T00", freq="6h"
+    )
+    return xr.DataArray(
+        rng.gamma(2.0, 50.0, size=(times.size, n_stations)),
+        coords={"time": times, "station": np.arange(n_stations)},
+        dims=["time", "station"],
+        name="dis",
+    )
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def relative_error(clim, exact):
+    # largest and mean errors relative to the average median of the climatology
+    error = np.abs(clim - exact) / exact.isel(ensemble=5).mean()
+    return (
+        f"max error {100 * float(error.max()):.2f}%, "
+        f"mean {100 * float(error.mean()):.3f}%"
+    )
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Compare exact and sketch percentile climatologies"
+    )
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--first_year", type=int, default=1991)
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--window", type=int, default=61)
+    parser.add_argument(
+        "--compression", type=int, nargs="+", default=[50, 100, 200, 400]
+    )
+    args = parser.parse_args()
+
+    log.basicConfig(level=log.INFO, format="%(message)s")
+
+    da = synthetic_data(args.stations, args.first_year, args.years)
+    p_values = np.arange(0, 101, 10)
+    log.info(
+        f"{args.stations} stations x {args.years} years, "
+        f"window of {args.window} days"
+    )
+
+    exact, elapsed = timed(compute_climatology, da, p_values, args.window)
+    log.info(f"{'exact':>20}: {elapsed:.2f}s, {exact.nbytes / 2**20:.1f} MiB")
+
+    for compression in args.compression:
+        sketches, build_time = timed(
+            climatology_sketch, da, args.window, compression=compression
+        )
+        clim, query_time = timed(sketch_percentiles, sketches, p_values)
+        log.info(
+            f"{f'sketch/{compression}':>20}: {build_time + query_time:.2f}s, "
+            f"{sketches.nbytes / 2**20:.1f} MiB, {relative_error(clim, exact)}"
+        )
+
+    # one sketch per year, merged into the running climatology as years arrive
+    compression = args.compression[len(args.compression) // 2]
+    start = time.perf_counter()
+    merged = None
+    for year in range(args.first_year, args.first_year + args.years):
+        year_da = da.sel(time=slice(f"{year}-01-01T06", f"{year + 1}-01-01T00"))
+        sketches = climatology_sketch(year_da, args.window, compression=compression)
+        merged = sketches if merged is None else merge_sketches([merged, sketches])
+    clim = sketch_percentiles(merged, p_values)
+    log.info(
+        f"{f'yearly/{compression}':>20}: {time.perf_counter() - start:.2f}s, "
+        f"{relative_error(clim, exact)}"
+    )
@@ -4,22 +4,15 @@ import argparse
 import glob
 import logging as log
 import os
+import time
 from os import path
 
 import dask
 import numpy as np
 import pandas as pd
 import xarray as xr
-from danu import stats, utils
 
-
-@dask.delayed
-def persistence_crps(reanalysis, persistence):
-
-    # compute statistics for one forecast date
-    crps_pers = np.fabs(reanalysis - persistence)
-
-    return crps_pers
+from hyve.hydrostats.probabilistic import crps_per_time
 
 
 def shift_dates(dates, istart, n_dates=104, days=[0, 4]):
@@ -58,140 +51,96 @@ def coord_dmh(dates):
     return days_months
 
 
-@utils.timer
+def open_reforecasts(reforecast_files, core_dim="station"):
+    # every file is one forecast date, stacked along "date" with lead times
+    # along "step" and their valid times kept per date
+    def preprocess(ds):
+        ds = ds.rename({core_dim: "station"}) if core_dim != "station" else ds
+        ds = ds[["dis"]].assign(valid_time=ds["time"])
+        return ds.swap_dims({"time": "step"}).drop_vars("time")
+
+    return xr.open_mfdataset(
+        sorted(reforecast_files),
+        combine="nested",
+        concat_dim="date",
+        join="inner",
+        preprocess=preprocess,
+    )
+
+
 def compute_score(
-    out_dir, reforecast_dir, ds_reanalysis, ds_clim, core_dims, with_init=False
+    out_dir,
+    reforecast_files,
+    da_reanalysis,
+    da_clim,
+    core_dim="station",
+    with_init=False,
+    fair=False,
 ):
 
-    print("\nComputing crps and crpss\n")
-
-    reforecast_files = glob.glob(reforecast_dir + "/*.nc")
-    da_ref = xr.open_dataset(os.path.join(args.reforecast, reforecast_files[0]))
-    set1 = set(da_ref.station.values)
-    set2 = set(ds_reanalysis.station.values)
-    stations = list(set1.intersection(set2))
-    da_ref = da_ref.sel(station=stations)
-    da_ref = da_ref["dis"].sel(ensemble=0)
-
-    crps_refc_mean = xr.DataArray(np.zeros(da_ref.shape), dims=da_ref.dims)
-    crps_pers_mean = xr.DataArray(np.zeros(da_ref.shape), dims=da_ref.dims)
-    if ds_clim is not None:
-        crps_clim_mean = xr.DataArray(np.zeros(da_ref.shape), dims=da_ref.dims)
-
-    n_dates = len(reforecast_files)
-    log.info("Number of reforecast datasets in folder: " + str(n_dates))
-
-    count = 0
-    for reforecast_path in reforecast_files:
-
-        log.info("- {}: {}".format(count, reforecast_path))
-        ds_reforecast = xr.open_dataset(os.path.join(args.reforecast, reforecast_path))
-
-        set1 = set(ds_reforecast.station.values)
-        set2 = set(ds_reanalysis.station.values)
-        stations = list(set1.intersection(set2))
-        ds_reforecast = ds_reforecast.sel(station=stations)
-        ds_reanalysis = ds_reanalysis.sel(station=stations)
-
-        date_range = ds_reforecast.time
-        step = (date_range.values[1] - date_range.values[0]).astype(
-            "timedelta64[h]"
-        ) / np.timedelta64(1, "h")
-        date_persistence = date_range[0]
-        if not with_init:
-            date_persistence = date_persistence - np.timedelta64(int(step), "h")
-        log.info(
-            "First step: {}, time step: {} hours".format(date_range.values[0], step)
+    log.info("Computing crps and crpss")
+    start_time = time.perf_counter()
+
+    ds_reforecast = open_reforecasts(reforecast_files, core_dim)
+    stations = np.intersect1d(
+        ds_reforecast.station.values, da_reanalysis.station.values
+    )
+    ds_reforecast = ds_reforecast.sel(station=stations)
+    da_reanalysis = da_reanalysis.sel(station=stations)
+    log.info(
+        "Number of reforecast datasets: {}, stations: {}".format(
+            ds_reforecast.sizes["date"], stations.size
         )
-        log.info("Persistence date is {}".format(date_persistence.values))
-
-        reforecast = ds_reforecast["dis"].sel(time=date_range)
-        reforecast = reforecast.transpose("time", "ensemble", *core_dims)
-
-        # extract arrays of interest
-        reanalysis = ds_reanalysis.sel(time=date_range)
-        persistence = ds_reanalysis.sel(time=date_persistence)
-
-        # num = 10
-        # print(reforecast.isel(station=num, time=1).values)
-        # print(reanalysis.isel(station=num, time=1))
-        # print(persistence.isel(station=num))
-        # compute statistics for one forecast date
-        # print(reanalysis.station.values)
-        # print(reforecast.station.values)
-        # for i in range(len(reanalysis.station.values)):
-        #     print(reanalysis.station.values[i], reforecast.station.values[i])
-        #     assert reforecast.station.values[i] == reanalysis.station.values[i]
-        crps_pers = persistence_crps(reanalysis, persistence)
-        crps_refo = stats.forecast_crps(reforecast, reanalysis, core_dims=core_dims)
-        if ds_clim is not None:
-            log.debug(coord_dmh(date_range))
-            climatology = ds_clim.sel(time=coord_dmh(date_range))
-            climatology.coords["time"] = date_range
-            crps_clim = stats.forecast_crps(
-                climatology, reanalysis, core_dims=core_dims
-            )
-            crps_refo, crps_pers, crps_clim = dask.compute(
-                crps_refo, crps_pers, crps_clim
-            )
-        else:
-            crps_refo, crps_pers = dask.compute(crps_refo, crps_pers)
-
-        # print(crps_refo.isel(station=num, time=1).values)
-        # print(crps_pers.isel(station=num, time=1).values)
-        # exit(1)
-
-        # write forecast files
-        if out_dir:
-            crps_refo = crps_refo.rename("crps")
-            refo_file = path.join(out_dir, "crps_refo_{:04}.nc".format(int(count)))
-            crps_refo.to_netcdf(refo_file)
-            crps_pers = crps_pers.rename("crps")
-            pers_file = path.join(out_dir, "crps_pers_{:04}.nc".format(int(count)))
-            crps_pers.to_netcdf(pers_file)
-            if ds_clim is not None:
-                crps_clim = crps_clim.rename("crps")
-                clim_file = path.join(out_dir, "crps_clim_{:04}.nc".format(int(count)))
-                crps_clim.to_netcdf(clim_file)
-
-        crps_refo = crps_refo.drop("time")
-        crps_pers = crps_pers.drop("time")
-        crps_refc_mean = crps_refc_mean + crps_refo
-        crps_pers_mean = crps_pers_mean + crps_pers
-        if ds_clim is not None:
-            crps_clim = crps_clim.drop("time")
-            crps_clim_mean = crps_clim_mean + crps_clim
-
-        count += 1
-
-    # write statistics files
-    crps_refc_mean = crps_refc_mean / n_dates
-    crps_pers_mean = crps_pers_mean / n_dates
-
-    print(crps_refc_mean.isel(station=range(10)))
-    crps_refc_mean = crps_refc_mean.rename("crps")
-    crps_refc_mean.to_netcdf("crps_refo.nc")
-    print(crps_pers_mean.isel(station=range(10)))
-    crps_pers_mean = crps_pers_mean.rename("crps")
-    crps_pers_mean.to_netcdf("crps_pers.nc")
-
-    crpss_pers = 1 - (crps_refc_mean / crps_pers_mean)
-    crpss_pers = crpss_pers.rename("crpss")
-    print(crpss_pers.isel(station=range(10)))
-    crpss_pers.to_netcdf("crpss_pers.nc")
-
-    if ds_clim is not None:
-        crps_clim_mean = crps_clim_mean / n_dates
-        print(crps_clim_mean.isel(station=range(10)))
-        crps_clim_mean = crps_clim_mean.rename("crps")
-        crps_clim_mean.to_netcdf("crps_clim.nc")
-
-        crpss_clim = 1 - (crps_refc_mean / crps_clim_mean)
-        crpss_clim = crpss_clim.rename("crpss")
-        print(crpss_clim.isel(station=range(10)))
-        crpss_clim.to_netcdf("crpss_clim.nc")
-
-    assert count == n_dates
+    )
+
+    valid_time = ds_reforecast["valid_time"].load()
+    step = valid_time.isel(step=1) - valid_time.isel(step=0)
+    persistence_time = valid_time.isel(step=0)
+    if not with_init:
+        persistence_time = persistence_time - step
+
+    # all dates, steps and stations are scored at once, deterministic
+    # persistence as a single-member ensemble
+    reanalysis = da_reanalysis.sel(time=valid_time).drop_vars("time")
+    persistence = da_reanalysis.sel(time=persistence_time).drop_vars("time")
+    scores = {
+        "refo": crps_per_time(ds_reforecast["dis"], reanalysis, fair=fair),
+        "pers": crps_per_time(persistence, reanalysis),
+    }
+    if da_clim is not None:
+        # the climatology percentiles are the members of a reference ensemble
+        labels = np.reshape(coord_dmh(valid_time.values.ravel()), valid_time.shape)
+        labels = xr.DataArray(labels, dims=valid_time.dims)
+        climatology = da_clim.sel(station=stations, time=labels).drop_vars("time")
+        scores["clim"] = crps_per_time(climatology, reanalysis)
+
+    scores = {
+        name: crps.transpose("date", "step", ...)
+        for name, crps in zip(scores, dask.compute(*scores.values()))
+    }
+    log.info("Scores computed in {:.2f}s".format(time.perf_counter() - start_time))
+
+    # write the scores of every forecast date
+    if out_dir:
+        for name, crps in scores.items():
+            crps = crps.assign_coords(valid_time=valid_time).rename("crps")
+            crps.to_netcdf(path.join(out_dir, "crps_{}.nc".format(name)))
+
+    # averages over forecast dates, per lead time as "time"
+    means = {
+        name: crps.mean("date").rename(step="time").rename("crps")
+        for name, crps in scores.items()
+    }
+    for name, crps in means.items():
+        print(crps.isel(station=slice(10)))
+        crps.to_netcdf("crps_{}.nc".format(name))
+
+    for name in means:
+        if name == "refo":
+            continue
+        crpss = (1 - means["refo"] / means[name]).rename("crpss")
+        print(crpss.isel(station=slice(10)))
+        crpss.to_netcdf("crpss_{}.nc".format(name))
 
 
 if __name__ == "__main__":
@@ -207,11 +156,16 @@ if __name__ == "__main__":
         action="store_true",
         help="Activate if reforecast dataset does not include initial condition",
     )
+    parser.add_argument(
+        "--fair",
+        action="store_true",
+        help="Score the reforecast ensemble with the fair CRPS",
+    )
     parser.add_argument(
         "--scheduler",
         default="threads",
         choices=["synchronous", "threads"],
-        help="reanalysis dataset file",
+        help="dask scheduler",
     )
     parser.add_argument(
         "--log",
@@ -227,41 +181,26 @@ if __name__ == "__main__":
 
     log.info("Computing the scoring using crps approach")
 
-    with dask.config.set(scheduler="threads"):
+    with dask.config.set(scheduler=args.scheduler):
 
         core_dim = args.core_dim
-        core_dims = ["station"]
 
         # read reanalysis dataset
         ds_reanalysis = xr.open_dataset(args.reanalysis)
-
-        # read first reforecast dataset for check
-        reforecast_files = glob.glob(os.path.join(args.reforecast, "*.nc"))
-        print("Found {} files".format(len(reforecast_files)))
-        print(reforecast_files)
-        ds_reforecast = xr.open_dataset(reforecast_files[0])
-
-        ds_reforecast = ds_reforecast.rename({core_dim: "station"})
-        ds_reanalysis = ds_reanalysis.rename({core_dim: "station"})
-
+        if core_dim != "station":
+            ds_reanalysis = ds_reanalysis.rename({core_dim: "station"})
         print("Reanalysis dataset from {}:".format(args.reanalysis))
         print(ds_reanalysis["dis"])
-        print("Reforecast dataset from {}:".format(args.reforecast))
-        print(ds_reforecast["dis"])
-
-        set1 = set(ds_reforecast.station.values)
-        set2 = set(ds_reanalysis.station.values)
-        stations = list(set1.intersection(set2))
-        ds_reforecast = ds_reforecast.sel(station=stations)
-        ds_reanalysis = ds_reanalysis.sel(station=stations)
-        print(ds_reanalysis["dis"])
-        print(ds_reforecast["dis"])
+
+        reforecast_files = glob.glob(os.path.join(args.reforecast, "*.nc"))
+        print("Found {} files in {}".format(len(reforecast_files), args.reforecast))
 
         ds_clim = None
         if args.climatology:
-            ds_clim = xr.open_dataarray(args.climatology, chunks={"time": 1})
+            ds_clim = xr.open_dataarray(args.climatology).load()
             if core_dim != "station":
                 ds_clim = ds_clim.rename({core_dim: "station"})
+            # the climatology is computed from the reanalysis, station by station
             ds_clim = ds_clim.assign_coords(
                 {"station": ds_reanalysis.coords["station"]}
             )
@@ -272,9 +211,10 @@ if __name__ == "__main__":
 
         compute_score(
             args.output,
-            args.reforecast,
-            ds_reanalysis["dis"],
+            reforecast_files,
+            ds_reanalysis["dis"].load(),
             ds_clim,
-            core_dims,
+            core_dim,
             args.with_init,
+            args.fair,
         )
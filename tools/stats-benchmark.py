@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging as log
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from hyve.hydrostats.moments import FUSED_STATS
+from hyve.hydrostats.stat_calc import compute_stats
+
+
+def synthetic_data(n_stations, n_steps, nan_fraction, seed=0):
+    rng = np.random.default_rng(seed)
+    obs = rng.gamma(2.0, 50.0, size=(n_steps, n_stations))
+    sim = obs * rng.normal(1.0, 0.2, size=obs.shape)
+    obs[rng.random(obs.shape) < nan_fraction] = np.nan
+    coords = {
+        "time": pd.date_range("1980-01-01", periods=n_steps, freq="6h"),
+        "station": np.arange(n_stations),
+    }
+    sim_da = xr.DataArray(sim, coords=coords, dims=["time", "station"])
+    obs_da = xr.DataArray(obs, coords=coords, dims=["time", "station"])
+    return sim_da, obs_da
+
+
+def run(sim_da, obs_da, stat_names, engine, backend, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stat_dict = compute_stats(
+            sim_da, obs_da, "time", stat_names, engine=engine, backend=backend
+        )
+        xr.Dataset(stat_dict).compute()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Compare the xarray and fused statistics backends"
+    )
+    parser.add_argument("--stations", type=int, default=5000)
+    parser.add_argument("--steps", type=int, default=4 * 365 * 10)
+    parser.add_argument("--nan_fraction", type=float, default=0.05)
+    parser.add_argument(
+        "--stats", nargs="+", default=FUSED_STATS, help="statistics to compute"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunks", type=int, help="station chunk size for dask")
+    args = parser.parse_args()
+
+    log.basicConfig(level=log.INFO, format="%(message)s")
+
+    sim_da, obs_da = synthetic_data(args.stations, args.steps, args.nan_fraction)
+    if args.chunks:
+        sim_da = sim_da.chunk({"station": args.chunks})
+        obs_da = obs_da.chunk({"station": args.chunks})
+    log.info(
+        f"{args.stations} stations x {args.steps} steps, "
+        f"stats: {', '.join(args.stats)}"
+    )
+
+    # warm up the numba kernels so compilation is not timed
+    compute_stats(
+        sim_da.isel(station=[0]), obs_da.isel(station=[0]), "time", args.stats
+    )
+
+    for engine, backend in [("xarray", None), ("fused", "numpy"), ("fused", "numba")]:
+        elapsed = run(sim_da, obs_da, args.stats, engine, backend, args.repeat)
+        label = engine if backend is None else f"{engine}/{backend}"
+        log.info(f"{label:>12}: {elapsed:.3f}s")